@@ -0,0 +1,454 @@
+#!/bin/python3
+import os
+import sys
+import io
+import time
+import json
+import random
+import shutil
+import tempfile
+import platform
+import subprocess
+import contextlib
+import statistics
+
+from docopt import docopt
+
+from cutter import Cutter
+import datafiles
+from frameindex import FrameIndex
+from encoder import ParallelEncoder
+
+
+doc = """ffcutter benchmarks
+
+Usage:
+    bench compare <old-results> <new-results>
+    bench [-o <results-file>] [-n <repeat>] [--quick] [--fixtures=<dir>] [<benchmark>...]
+    bench -h | --help
+
+Options:
+    -o <results-file>       Write results into this JSON file. Default is "bench-<commit>.json".
+    -n <repeat>             Repeat every measurement n times and report the best run [default: 3].
+    --quick                 Use small fixtures.
+    --fixtures=<dir>        Generate fixtures into this directory and reuse them on later runs.
+                            Default is a temporary directory that is removed afterwards.
+
+Benchmarks:
+    probe       Frame rate probe and packet index time per video.
+    datacut     save_data_file throughput per telemetry size.
+    batch       Whole cut list: command building, data cutting and ffmpeg runs.
+    encode      Segment-parallel re-encode, wall time and speedup per number of ffmpeg processes.
+    segments    put_anchor/del_anchor latency (needs PyQt5 and libmpv).
+    paint       Seekbar paint time (needs PyQt5 and libmpv).
+
+All benchmarks run when none is given. Fixtures are generated locally with ffmpeg's lavfi testsrc and
+a seeded random generator, so results of two commits are comparable with "bench compare".
+"""
+
+# (seconds, fps, gop)
+VIDEOS = [(10, 30, 30), (10, 60, 250), (60, 30, 30), (60, 240, 240)]
+QUICK_VIDEOS = [(2, 30, 30), (2, 60, 120)]
+
+# frames of synthetic telemetry, one sync row per frame
+DATA_ROWS = [10000, 100000, 1000000]
+QUICK_DATA_ROWS = [1000, 10000]
+
+CAN_COLUMNS = 4
+SEED = 1234
+
+
+# Fixtures ####################################################################################
+###############################################################################################
+
+def make_video(path, seconds, fps, gop):
+    if not os.path.exists(path):
+        src = 'testsrc=duration=%s:size=320x240:rate=%s' % (seconds, fps)
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', src,
+                        '-c:v', 'mpeg4', '-g', str(gop), path], check=True)
+    return path
+
+
+def make_data_dir(path, frames, video=None, seed=SEED):
+    """ Synthetic recording directory: metainfo.txt, sync (frame -> CAN indexes), dgps_car (one row per CAN index)
+    and cam_params. """
+    if os.path.exists(os.path.join(path, 'metainfo.txt')):
+        return path
+    os.makedirs(path, exist_ok=True)
+    rnd = random.Random(seed + frames)
+
+    can = 0
+    with open(os.path.join(path, 'sync.txt'), 'w') as fp:
+        fp.write('idx, time, %s\n' % ', '.join('can%d' % c for c in range(CAN_COLUMNS)))
+        for i in range(frames):
+            can += rnd.randint(1, 3)
+            values = [can - c if rnd.random() > 0.05 else 0 for c in range(CAN_COLUMNS)]
+            values[0] = can
+            fp.write('%d, %.6f, %s\n' % (i, i / 30, ', '.join(str(v) for v in values)))
+
+    with open(os.path.join(path, 'dgps_car.txt'), 'w') as fp:
+        for i in range(can + 1):
+            fp.write('%d,%.7f,%.7f,%.3f\n' % (i, 37.5 + rnd.random() / 100, 127.0 + rnd.random() / 100,
+                                              rnd.random() * 30))
+
+    with open(os.path.join(path, 'cam_params.txt'), 'w') as fp:
+        for i in range(2000):
+            fp.write('param%d=%f\n' % (i, rnd.random()))
+
+    cam = 'cam.mp4'
+    if video is not None:
+        shutil.copyfile(video, os.path.join(path, cam))
+    with open(os.path.join(path, 'metainfo.txt'), 'w', newline='') as fp:
+        fp.write('cam=%s\r\nsync=sync.txt\r\ndgps_car=dgps_car.txt\r\ncam_params=cam_params.txt\r\n' % cam)
+    return path
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+# Measuring ###################################################################################
+###############################################################################################
+
+def best_of(repeat, func, *args, setup=None):
+    """ Returns (best wall time, return value of the best run). """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        rv = func(*args)
+        t = time.perf_counter() - t
+        if best is None or t < best[0]:
+            best = (t, rv)
+    return best
+
+
+def case(name, **metrics):
+    return {'case': name, 'metrics': metrics}
+
+
+# Benchmarks ##################################################################################
+###############################################################################################
+
+def bench_probe(ctx):
+    cases = []
+    for video in ctx['videos']:
+        cutter = Cutter()
+
+        def probe():
+            cutter.frame_rates.clear()
+            return cutter.get_frame_duration(video)
+
+        probe_time, _ = best_of(ctx['repeat'], probe)
+
+        def index():
+            return FrameIndex.from_ffprobe('ffprobe', video)
+
+        index_time, frame_index = best_of(ctx['repeat'], index)
+        packets = len(frame_index.pts)
+        cases.append(case(os.path.basename(video), probe_s=probe_time, index_s=index_time, packets=packets,
+                          packets_per_s=packets / index_time, index_bytes=frame_index.nbytes))
+    return cases
+
+
+def bench_datacut(ctx):
+    check_clone_file(ctx['tmp'])
+    cases = []
+    runs = [(path, c, 'text') for path in ctx['data_dirs'] for c in (False, True)]
+    runs += [(path, False, fmt) for path in ctx['data_dirs'][:1] for fmt in datafiles.DATA_FORMATS[1:]]
+    for path, column_cache, data_format in runs:
+        if (column_cache or data_format in ('npy', 'npz')) and datafiles.numpy is None:
+            continue
+        frames = ctx['frames'][path]
+        out = os.path.join(ctx['tmp'], 'datacut-out')
+        start, end = frames // 4, frames * 3 // 4
+        cutter = Cutter()
+        cutter.column_cache = column_cache
+        cutter.data_format = data_format
+
+        def setup():
+            shutil.rmtree(out, ignore_errors=True)
+
+        # the first run builds the lookup table and the column cache, best_of keeps the warm runs
+        seconds, _ = best_of(ctx['repeat'] + 1, cutter.save_data_file, [path, out, start, end], 'cam.part.mp4',
+                             setup=setup)
+        written = dir_size(out)
+        check_metainfo(cutter, path, out)
+        if data_format != 'text':
+            cases.append(case('rows=%d %s' % (frames, data_format), seconds=seconds,
+                              mb_per_s=written / seconds / 2**20, bytes_written=written))
+            continue
+        rows = sum(1 for f in os.listdir(out) if f.startswith(('sync', 'dgps'))
+                   for _ in open(os.path.join(out, f)))
+        cases.append(case('rows=%d%s' % (frames, ' cached' if column_cache else ''), seconds=seconds,
+                          mb_per_s=written / seconds / 2**20, rows_per_s=rows / seconds, bytes_written=written))
+    return cases
+
+
+def check_clone_file(tmp):
+    """ Copying over a hardlink of the source, as a rerun without --hardlink does, mustn't truncate the source. """
+    src, dst = os.path.join(tmp, 'clone-src'), os.path.join(tmp, 'clone-dst')
+    with open(src, 'wb') as fp:
+        fp.write(b'x' * 4096)
+    for link in (True, False, True, True):
+        datafiles.clone_file(src, dst, link=link)
+        if os.path.getsize(src) != 4096 or os.path.getsize(dst) != 4096:
+            raise RuntimeError('clone_file(link=%s) over a previous clone changed the source' % link)
+    if datafiles.clone_file(src, src) != 'same' or os.path.getsize(src) != 4096:
+        raise RuntimeError('clone_file onto itself changed the source')
+    os.remove(src)
+    os.remove(dst)
+
+
+def check_metainfo(cutter, path, out):
+    """ The metainfo.txt of a cut has to read back: the data streams of the input, each naming an existing file,
+    with the row layout of every converted file. """
+    def streams(metainfo):
+        return {key for key in metainfo if key not in cutter.ignored_keys and not key.endswith('_layout')}
+    source = dict(cutter.read_metainfo(os.path.join(path, 'metainfo.txt')))
+    metainfo = dict(cutter.read_metainfo(os.path.join(out, 'metainfo.txt')))
+    if streams(metainfo) != streams(source):
+        raise RuntimeError('metainfo.txt of the cut has the streams %s, expected %s' % (
+            sorted(streams(metainfo)), sorted(streams(source))))
+    for key in streams(metainfo):
+        if not os.path.isfile(os.path.join(out, metainfo[key])):
+            raise RuntimeError('metainfo.txt names a missing file: %s=%s' % (key, metainfo[key]))
+        if cutter.data_format != 'text' and cutter.stream_kinds.get(key, 'copy') != 'copy':
+            layout = metainfo.get(key + '_layout', '')
+            if not layout or not all(field.count(':') == 1 for field in layout.split(',')):
+                raise RuntimeError('metainfo.txt has no valid %s_layout: "%s"' % (key, layout))
+
+
+def bench_batch(ctx):
+    if not ctx['videos']:
+        return []
+    out = os.path.join(ctx['tmp'], 'batch-out')
+    cut_list = os.path.join(ctx['tmp'], 'batch.txt')
+    with open(cut_list, 'w') as fp:
+        for i in range(10):
+            video = ctx['videos'][i % len(ctx['videos'])]
+            fp.write('%s %s %d %d\n' % (video, out, 10 + i, 40 + i))
+        for path in ctx['data_dirs'][:1]:
+            fp.write('%s %s %d %d\n' % (path, out, 10, 40))
+
+    def run():
+        cutter = Cutter()
+        t = time.perf_counter()
+        commands = [cutter.make_ffmpeg_command(seg) for seg in cutter.read_text_file(cut_list)]
+        build = time.perf_counter() - t
+        for cmd in commands:
+            subprocess.run(cmd[:1] + ['-v', 'error'] + cmd[1:], check=True)
+        return build, len(commands)
+
+    seconds, (build, jobs) = best_of(ctx['repeat'], run, setup=lambda: shutil.rmtree(out, ignore_errors=True))
+    return [case('jobs=%d' % jobs, seconds=seconds, build_s=build, jobs_per_s=jobs / seconds,
+                 mb_per_s=dir_size(out) / seconds / 2**20)]
+
+
+def bench_encode(ctx):
+    if not ctx['videos']:
+        return []
+    video = max(ctx['videos'], key=os.path.getsize)
+    ipts = FrameIndex.from_ffprobe('ffprobe', video).ipts
+    duration = float(ipts[-1]) if len(ipts) else 1
+    segments = [(duration * i / 4, duration * (i + 0.8) / 4) for i in range(4)]
+    out = os.path.join(ctx['tmp'], 'encode-out')
+    outfiles = [os.path.join(out, 'part%d.mp4' % i) for i in range(len(segments))]
+
+    def setup():
+        shutil.rmtree(out, ignore_errors=True)
+        os.makedirs(out)
+
+    cases = []
+    baseline = None
+    for jobs in sorted({1, 2, os.cpu_count() or 1}):
+        encoder = ParallelEncoder('ffmpeg', video, segments, outfiles, ipts, jobs, ['-v', 'error'],
+                                  ['-c:v', 'mpeg4', '-q:v', '3'], log=lambda *args: None)
+        seconds, code = best_of(ctx['repeat'], encoder.run, setup=setup)
+        if code != 0:
+            raise RuntimeError('encoding with %d jobs failed: %s' % (jobs, code))
+        baseline = baseline or seconds
+        cases.append(case('%s jobs=%d' % (os.path.basename(video), jobs), seconds=seconds,
+                          speedup=baseline / seconds, chunks=len(encoder.chunks)))
+    return cases
+
+
+def make_gui():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5 import QtWidgets
+    import ffcutter
+
+    class Player(object):
+        chapter_list = [{'time': t * 36.0} for t in range(100)]
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    with contextlib.redirect_stdout(io.StringIO()):
+        gui = ffcutter.GUI()
+    gui.player = Player()
+    gui.playback_len = 3600.0
+    gui.playback_pos = 0.0
+    gui.state_loaded = True
+    return app, gui
+
+
+def bench_segments(ctx):
+    _app, gui = ctx['gui']
+    rnd = random.Random(SEED)
+    cases = []
+    for count in (10, 100, 1000):
+        times = []
+        gui.segments = []
+        gui.anchor = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(count):
+                gui.playback_pos = rnd.uniform(0, gui.playback_len)
+                t = time.perf_counter()
+                gui.put_anchor()
+                times.append(time.perf_counter() - t)
+            for _ in range(count // 10):
+                gui.closest_anchor = gui.segments[0][0] if gui.segments else None
+                t = time.perf_counter()
+                gui.del_anchor()
+                times.append(time.perf_counter() - t)
+        times.sort()
+        cases.append(case('ops=%d' % len(times), mean_us=statistics.mean(times) * 1e6,
+                          p95_us=times[int(len(times) * 0.95)] * 1e6, segments=len(gui.segments)))
+    return cases
+
+
+def bench_paint(ctx):
+    _app, gui = ctx['gui']
+    gui.ui.seekbar.resize(1920, 30)
+    cases = []
+    for count in (10, 100, 1000):
+        step = gui.playback_len / count
+        gui.segments = [(i * step, i * step + step / 2) for i in range(count)]
+
+        def paint():
+            for _ in range(50):
+                gui.ui.seekbar.repaint()
+
+        seconds, _ = best_of(ctx['repeat'], paint)
+        cases.append(case('segments=%d' % count, paint_us=seconds / 50 * 1e6))
+    return cases
+
+
+BENCHMARKS = {
+    'probe': bench_probe,
+    'datacut': bench_datacut,
+    'batch': bench_batch,
+    'encode': bench_encode,
+    'segments': bench_segments,
+    'paint': bench_paint,
+}
+
+
+# Results #####################################################################################
+###############################################################################################
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.decode().strip() or None
+    except OSError:
+        return None
+
+
+def ffmpeg_version():
+    try:
+        return subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE).stdout.decode().splitlines()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def compare(old_file, new_file):
+    with open(old_file) as fp:
+        old = json.load(fp)
+    with open(new_file) as fp:
+        new = json.load(fp)
+
+    print('%s -> %s' % (old.get('commit'), new.get('commit')))
+    for name, cases in new['results'].items():
+        old_cases = {c['case']: c['metrics'] for c in old['results'].get(name, [])}
+        for c in cases:
+            for metric, value in c['metrics'].items():
+                prev = old_cases.get(c['case'], {}).get(metric)
+                if prev:
+                    change = '%+.1f%%' % ((value - prev) / prev * 100)
+                else:
+                    change = 'new'
+                print('%-10s %-24s %-14s %14.4g %14.4g %10s' % (name, c['case'], metric, prev or 0, value, change))
+
+
+def run(args):
+    names = args['<benchmark>'] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit('Unknown benchmark: %s' % name)
+
+    tmp = tempfile.mkdtemp(prefix='ffcutter-bench-')
+    fixtures = args['--fixtures'] or os.path.join(tmp, 'fixtures')
+    os.makedirs(fixtures, exist_ok=True)
+    quick = args['--quick']
+    ctx = {'tmp': tmp, 'repeat': int(args['-n']), 'videos': [], 'data_dirs': [], 'frames': {}}
+    results = {}
+    skipped = {}
+
+    try:
+        if shutil.which('ffmpeg') and shutil.which('ffprobe'):
+            for seconds, fps, gop in (QUICK_VIDEOS if quick else VIDEOS):
+                name = 'testsrc-%ds-%dfps-gop%d.mp4' % (seconds, fps, gop)
+                ctx['videos'].append(make_video(os.path.join(fixtures, name), seconds, fps, gop))
+        else:
+            for name in ('probe', 'batch', 'encode'):
+                skipped[name] = 'ffmpeg/ffprobe not found'
+
+        for frames in (QUICK_DATA_ROWS if quick else DATA_ROWS):
+            video = ctx['videos'][0] if ctx['videos'] else None
+            path = make_data_dir(os.path.join(fixtures, 'data-%d' % frames), frames, video)
+            ctx['data_dirs'].append(path)
+            ctx['frames'][path] = frames
+
+        if 'segments' in names or 'paint' in names:
+            try:
+                ctx['gui'] = make_gui()
+            except (ImportError, OSError) as ex:
+                skipped['segments'] = skipped['paint'] = 'GUI unavailable: %s' % ex
+
+        for name in names:
+            if name in skipped:
+                print('%s: skipped, %s' % (name, skipped[name]))
+                continue
+            print('%s...' % name)
+            results[name] = BENCHMARKS[name](ctx)
+            for c in results[name]:
+                print('    %s %s' % (c['case'], ' '.join('%s=%.4g' % m for m in c['metrics'].items())))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'ffmpeg': ffmpeg_version(),
+        'quick': quick,
+        'repeat': ctx['repeat'],
+        'results': results,
+        'skipped': skipped,
+    }
+    results_file = args['-o'] or 'bench-%s.json' % (commit or 'unknown')
+    with open(results_file, 'w') as fp:
+        json.dump(report, fp, indent=2)
+    print('Results written to %s' % results_file)
+
+
+if __name__ == '__main__':
+    args = docopt(doc)
+    if args['compare']:
+        compare(args['<old-results>'], args['<new-results>'])
+    else:
+        run(args)
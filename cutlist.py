@@ -0,0 +1,105 @@
+import os
+import csv
+import json
+import shlex
+
+CUT_LIST_EXTENSIONS = ('.txt', '.csv', '.jsonl')
+FIELDS = ('input', 'output', 'start', 'end')
+# per line options, see Cutter.make_ffmpeg_command
+LINE_OPTIONS = ('streams', 'args')
+
+
+class CutList(object):
+    """ Streaming reader of a cut list, one segment [input, output, start, end, options] per line, read as the
+    jobs are started so a long list starts right away and doesn't have to fit in memory.
+
+    .txt: the space separated fields, quoted like a shell line if they contain spaces, then key=value options.
+    A line with an unbalanced quote is split at whitespace only, like before quoting was supported.
+    .csv: columns input, output, start, end and option columns, with an optional header row naming them.
+    .jsonl: one object per line with these keys.
+
+    Lines that can't be read are reported with log_error and skipped. """
+
+    def __init__(self, filename, log_error=print):
+        self.filename = filename
+        self.log_error = log_error
+        self.format = os.path.splitext(filename)[1].lower().lstrip('.')
+        self.lines = 0
+        self.skipped = 0
+        self.columns = None # of a csv file
+
+    def __iter__(self):
+        parse = {'csv': self.parse_csv, 'jsonl': self.parse_jsonl}.get(self.format, self.parse_txt)
+        with open(self.filename, 'r', encoding='utf-8', newline='') as fp:
+            for number, line in enumerate(fp, 1):
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                try:
+                    entry = parse(line, number)
+                    if entry is None:
+                        continue
+                    segment = make_segment(entry)
+                except ValueError as e:
+                    self.lines += 1
+                    self.skipped += 1
+                    self.log_error('%s:%d: %s, skipped' % (self.filename, number, e))
+                    continue
+                self.lines += 1
+                yield segment
+
+    def parse_txt(self, line, number):
+        lexer = shlex.shlex(line, posix=True)
+        lexer.whitespace_split = True
+        lexer.escape = '' # windows paths
+        lexer.commenters = '' # run#3.mp4
+        try:
+            args = list(lexer)
+        except ValueError: # an unquoted path with a quote in it, read as before quoting
+            args = line.split()
+        if len(args) < 4:
+            raise ValueError('Expected: input output start end [key=value...]')
+        entry = dict(zip(FIELDS, args))
+        for arg in args[4:]:
+            key, sep, value = arg.partition('=')
+            if not sep:
+                raise ValueError('Expected key=value: "%s"' % arg)
+            entry[key] = value
+        return entry
+
+    def parse_csv(self, line, number):
+        row = next(csv.reader([line]))
+        if self.columns is None:
+            self.columns = FIELDS
+            if [field.strip().lower() for field in row[:4]] == list(FIELDS):
+                self.columns = tuple(field.strip().lower() for field in row)
+                return None # header
+        columns = self.columns
+        if len(row) < 4 or len(row) > len(columns):
+            raise ValueError('Expected the columns: %s' % ', '.join(columns))
+        return {key: value for key, value in zip(columns, row) if value != '' or key in FIELDS}
+
+    def parse_jsonl(self, line, number):
+        entry = json.loads(line)
+        if not isinstance(entry, dict):
+            raise ValueError('Expected an object')
+        return entry
+
+
+def make_segment(entry):
+    missing = [field for field in FIELDS if field not in entry]
+    if missing:
+        raise ValueError('Missing %s' % ', '.join(missing))
+    try:
+        start, end = int(entry['start']), int(entry['end'])
+    except (TypeError, ValueError):
+        raise ValueError('start and end have to be frame numbers')
+    if start < 0 or end < start:
+        raise ValueError('Invalid frame range %d-%d' % (start, end))
+    options = {}
+    for key, value in entry.items():
+        if key in FIELDS:
+            continue
+        if key not in LINE_OPTIONS:
+            raise ValueError('Unknown option "%s", expected: %s' % (key, ', '.join(LINE_OPTIONS)))
+        options[key] = value
+    return [str(entry['input']), str(entry['output']), start, end, options]
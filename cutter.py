@@ -0,0 +1,361 @@
+import os
+import shlex
+import subprocess
+import collections
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import tracer, traced
+from cutlist import CutList
+from metrics import recorder, Usage
+from probe import fingerprint, probe_streams, stream_maps
+from datafiles import CanTable, ColumnCache, clone_file, cut_sync_rows, rewrite_first_column
+from datafiles import ConversionError, TableWriter, is_compressed, open_data, stream_position, unlink_output
+
+
+class Cutter(object):
+    """ Cuts the jobs of a cut list: builds their ffmpeg commands and cuts the data files of directory inputs.
+    Doesn't depend on Qt, so it is shared by the GUI, the command line and the benchmarks. """
+
+    def __init__(self, ffmpeg_bin=None, ffprobe_bin=None):
+        self.ffmpeg_bin = ffmpeg_bin or 'ffmpeg'
+        self.ffprobe_bin = ffprobe_bin or 'ffprobe'
+        self.frame_rates = {}
+        # hardlink data files that are copied unchanged instead of copying them (outputs then share the inode)
+        self.link_unchanged = False
+        # cut the sync file from a columnar .npy copy of it (built on first use, needs numpy)
+        self.column_cache = False
+        # format of the cut sync/dgps_car files, one of datafiles.DATA_FORMATS
+        self.data_format = 'text'
+        # compress text cuts with 'gz', 'bz2' or 'xz' (npz files are zip compressed instead)
+        self.compress = None
+        # stream selection of every line (see probe.select_streams), a line's streams= option replaces it
+        self.streams = None
+        # LRU caches of metainfo.txt entries and sync lookup tables (probe.LRUCache) for a long running process
+        # like `ffcutter serve`, None to read them for every job
+        self.metainfo_cache = None
+        self.can_table_cache = None
+        # problems with a job that don't fail it, the GUI and the server send them to their logs
+        self.log_error = print
+
+    # Read cut list ###############################################################################
+    ###############################################################################################
+
+    def read_text_file(self, filename, log_error=print):
+        """ All segments of a cut list, see cutlist.CutList for reading it line by line. """
+        return list(CutList(filename, log_error))
+
+    # Make ffmpeg command #########################################################################
+    ###############################################################################################
+
+    def get_input_video(self, input_file):
+        # a directory input holds data files, its video is named by "cam=" in metainfo.txt
+        infile_name, ext = os.path.splitext(os.path.split(input_file)[1])
+        if ext == '' :
+            input_file = os.path.join(input_file ,self.get_infile_path(input_file))
+        return input_file
+
+    def get_frame_duration(self, input_file):
+        if input_file not in self.frame_rates:
+            cmd = [self.ffprobe_bin] + '-v 0 -of csv=p=0 -select_streams v:0 -show_entries stream=r_frame_rate'.split() + [input_file]
+            with tracer.span('ffprobe', args=' '.join(cmd)):
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+                cmdout, err = proc.communicate()
+            self.frame_rates[input_file] = float(Fraction(cmdout.decode("utf-8").strip()))
+        return 1/self.frame_rates[input_file]
+
+    @traced('make_ffmpeg_command')
+    def make_ffmpeg_command(self, video_segment, output_dir=None):
+        """ output_dir: where to cut into instead of the line's output directory (see jobs.Job) """
+        input_file = video_segment[0]        
+        infile_name, ext = os.path.splitext(os.path.split(input_file)[1])
+        input_file = self.get_input_video(input_file)
+        frame_duration = self.get_frame_duration(input_file)
+        
+        outfile_path = output_dir or video_segment[1]
+        os.makedirs(outfile_path, exist_ok=True)
+        
+        infile_name, _ext = os.path.splitext(os.path.split(input_file)[1])
+        start = video_segment[2]
+        end = video_segment[3]
+        tmpfile = '%s.part%d-%d%s' % (infile_name, start, end, _ext)
+        if ext == '':
+            self.save_data_file([video_segment[0], outfile_path, start, end], tmpfile)
+        tmpfile = os.path.join(outfile_path, tmpfile)
+
+            
+        
+
+        ffmpeg = self.ffmpeg_bin
+        start = start*frame_duration 
+        end = end*frame_duration + frame_duration
+
+        options = video_segment[4] if len(video_segment) > 4 else {}
+        spec = options.get('streams', self.streams)
+        maps = stream_maps(probe_streams(self.ffprobe_bin, input_file), spec) if spec else []
+
+        args = options.get('args', [])
+        if isinstance(args, str):
+            args = shlex.split(args)
+
+        command = ([ffmpeg, '-i', input_file, '-y', '-ss', str(start), '-to', str(end)] + maps + ['-c', 'copy'] +
+                   [str(arg) for arg in args] + [tmpfile])
+        
+        return command
+
+    # Save data file ##############################################################################
+    ###############################################################################################
+
+    def get_cmd_option(self, filename, option):
+        with open(filename, 'rb') as fp:
+            for line in fp:
+                line = line.decode()
+                if line.find(option) != -1 :
+                    line = line.replace(option, "", 1)
+                    line = line.rstrip("\r\n")
+                    return line
+    
+    def get_infile_path(self, infile_path):
+        metainfo_file = os.path.join(infile_path, "metainfo.txt")
+        cam_filename = self.get_cmd_option(metainfo_file, "cam=")
+        return cam_filename
+    
+    def read_metainfo(self, filename):
+        """ [(key, value)] of a metainfo.txt in file order """
+        if self.metainfo_cache is not None:
+            key = fingerprint(filename)
+            entries = self.metainfo_cache.get(key)
+            if entries is None:
+                entries = self.read_metainfo_file(filename)
+                self.metainfo_cache.put(key, entries)
+            return list(entries)
+        return self.read_metainfo_file(filename)
+
+    def read_metainfo_file(self, filename):
+        entries = []
+        with open(filename, 'rb') as fp:
+            for line in fp:
+                key, sep, value = line.decode().rstrip("\r\n").partition("=")
+                if sep:
+                    entries.append((key, value))
+        return entries
+
+    @traced('save_data_file')
+    def save_data_file(self, segment, video_filename):
+        infile_path = segment[0]
+        outfile_path = segment[1]
+        os.makedirs(outfile_path, exist_ok=True)
+        
+        start = segment[2]
+        end = segment[3]
+        
+        usage = Usage()
+        metainfo = []
+        kinds = {}
+        for key, value in self.read_metainfo(os.path.join(infile_path, "metainfo.txt")):
+            if key in self.ignored_keys or key.endswith('_layout'):
+                continue
+            kinds[key] = self.stream_kinds.get(key)
+            if kinds[key] is None:
+                if not os.path.isfile(os.path.join(infile_path, value)):
+                    print('Unknown metainfo entry "%s=%s" in %s is no file, skipped.' % (key, value, infile_path))
+                    continue
+                print('Unknown data stream "%s=%s" in %s, copied unchanged.' % (key, value, infile_path))
+                kinds[key] = 'copy'
+            metainfo.append((key, value))
+
+        # the CAN index range of the frames comes from the sync file's lookup table, no CSV parsing
+        min_canidx = max_canidx = sync_offset = None
+        if any(kind in ('sync', 'can_range') for kind in kinds.values()):
+            if 'sync' not in dict(metainfo):
+                raise ValueError('%s has no sync entry, needed to cut %s' % (
+                    os.path.join(infile_path, "metainfo.txt"),
+                    ', '.join(key for key, kind in kinds.items() if kind == 'can_range')))
+            sync_file = os.path.join(infile_path, dict(metainfo)['sync'])
+            can_table = self.open_can_table(sync_file)
+            try:
+                min_canidx, max_canidx = can_table.can_range(start, end)
+                sync_offset = can_table.offset(start-1)
+            finally:
+                if self.can_table_cache is None:
+                    can_table.close()
+
+        cuts = [StreamCut(key, os.path.join(infile_path, value),
+                          self.get_output_file(outfile_path, value, kinds[key], start, end),
+                          start, end, min_canidx, max_canidx, sync_offset, self.data_format)
+                for key, value in metainfo]
+        # the streams of a segment are independent, file IO, decompression and the mmap copies overlap
+        with ThreadPoolExecutor(max_workers=len(cuts) or 1) as pool:
+            results = list(pool.map(lambda cut: self.cut_stream(kinds[cut.key], cut), cuts))
+
+        lines = ["cam="+video_filename+"\n"]
+        if self.data_format != 'text':
+            lines.append("data_format="+self.data_format+"\n")
+        steps = {}
+        for cut, (output_file, meta, step) in zip(cuts, results):
+            lines.extend(meta)
+            lines.append(cut.key+"="+os.path.split(output_file)[1]+"\n")
+            steps[cut.key] = step
+        unlink_output(os.path.join(outfile_path, "metainfo.txt"))
+        with open(os.path.join(outfile_path, "metainfo.txt"), 'w') as fp:
+            fp.writelines(lines)
+
+        if recorder.enabled:
+            record = usage.stop()
+            for field in ('input_bytes', 'output_bytes', 'rows_read', 'rows_written'):
+                record[field] = sum(step[field] for step in steps.values())
+            recorder.write('save_data_file', input=infile_path, output=outfile_path, segment=[start, end],
+                           exit_code=0, steps=steps, **record)
+
+    def open_can_table(self, sync_file):
+        if self.can_table_cache is None:
+            return CanTable.open(sync_file)
+        # evicted tables are closed when the last job using them lets go of them
+        key = fingerprint(sync_file)
+        table = self.can_table_cache.get(key)
+        if table is None:
+            table = CanTable.open(sync_file)
+            self.can_table_cache.put(key, table)
+        return table
+
+    def get_output_file(self, outfile_path, filename, kind, start, end):
+        if kind == 'copy':
+            return os.path.join(outfile_path, filename)
+        if is_compressed(filename):
+            filename, ext = os.path.splitext(filename)
+        filename, ext = os.path.splitext(filename)
+        outputdata_filename = '%s.ffcutter.part%d-%d.txt' % (filename, start , end)
+        if self.compress and self.data_format == 'text':
+            outputdata_filename += '.' + self.compress
+        return os.path.join(outfile_path, outputdata_filename)
+
+    def open_output(self, cut, mode, header):
+        """ The text cut, converted into the cut's binary data format as it is written if it has one. """
+        if cut.data_format == 'text':
+            return open_data(cut.dst, mode)
+        return TableWriter(cut.dst, cut.data_format, header, bool(self.compress))
+
+    def close_output(self, cut, f_out, usage, input_bytes, rows_read, rows_written):
+        """ Closes a cut opened by open_output. Returns (file, metainfo lines of its row layout, step metrics). """
+        output_file, meta = cut.dst, []
+        if isinstance(f_out, TableWriter):
+            output_file, layout = f_out.finish()
+            meta = ['%s_layout=%s\n' % (cut.key, layout)]
+        f_out.close()
+        return output_file, meta, step_metrics(usage, input_bytes, output_file, rows_read, rows_written)
+
+    def cut_stream(self, kind, cut):
+        """ cut_<kind>, again as text if the cut doesn't convert into the binary data format. """
+        try:
+            return getattr(self, 'cut_' + kind)(cut)
+        except ConversionError as e:
+            self.log_error('%s: %s, kept as text.' % (cut.dst, e))
+            return getattr(self, 'cut_' + kind)(cut._replace(data_format='text'))
+
+    # Stream cutters ##############################################################################
+    ###############################################################################################
+
+    # metainfo key -> cut_<kind> method, keys that aren't listed are copied with a warning
+    stream_kinds = {
+        'sync': 'sync',
+        'dgps_car': 'can_range',
+        'cam_params': 'copy',
+    }
+    ignored_keys = {'cam', 'data_format'}
+
+    def cut_sync(self, cut):
+        """ Frame rows with the index renumbered from 0 and the positive CAN indexes shifted to the cut's range. """
+        with tracer.span('cut_' + cut.key):
+            usage = Usage()
+            start, end, min_canidx = cut.start, cut.end, cut.min_canidx
+            f_in = open_data(cut.src, 'r')
+            f_out = self.open_output(cut, 'w', True)
+            
+            f_out.write(f_in.readline())
+            header_bytes = stream_position(f_in)
+
+            cache = ColumnCache.open(cut.src) if self.column_cache else None
+            lines = cut_sync_rows(cache, start, end, min_canidx) if cache is not None else None
+            if lines is not None:
+                f_out.writelines(lines)
+                input_bytes = header_bytes + sum(values.itemsize for values in cache.columns) * len(lines)
+            else:
+                skipped = 0
+                if f_in.seekable():
+                    f_in.seek(cut.sync_offset)
+                    skipped = cut.sync_offset - header_bytes
+                else: # compressed
+                    for i in range(0, start-1):
+                        f_in.readline()
+
+                for i in range(start-1, end):
+                    line = f_in.readline()   
+                    line = line.replace(str(i), str(i- start + 1), 1)
+                    line_split = line.split(",")
+                    idx_time_parsing_line = line_split[0:2]
+                    data_parsing_line = list(map(int, line_split[2:]))                
+
+                    for i in range(len(data_parsing_line)):
+                        if data_parsing_line[i] > 0 :
+                            data_parsing_line[i] -= min_canidx
+                
+                    data_line = ", ".join(str(x) for x in data_parsing_line) + "\n"
+                    idx_time_line = ", ".join(str(x) for x in idx_time_parsing_line) + ", "
+                
+                    line = idx_time_line + data_line
+                    f_out.write(line)
+                input_bytes = stream_position(f_in) - skipped
+
+            f_in.close()
+            return self.close_output(cut, f_out, usage, input_bytes, end - start + 2, end - start + 2)
+
+    def cut_can_range(self, cut):
+        """ Rows of the cut's CAN index range, one row per CAN index, renumbered from 0. """
+        return self.rewrite_rows(cut, cut.min_canidx, cut.max_canidx + 1)
+
+    def cut_row_range(self, cut):
+        """ Rows of the cut's frames, one row per frame, renumbered from 0. """
+        return self.rewrite_rows(cut, cut.start - 1, cut.end)
+
+    def rewrite_rows(self, cut, first, stop):
+        with tracer.span('cut_' + cut.key):
+            usage = Usage()
+            # only the index column changes, the rest of the lines is sliced out of a memory map
+            f_out = self.open_output(cut, 'wb', False)
+            bytes_read = rewrite_first_column(cut.src, f_out, first, stop, first)
+            if bytes_read is None:
+                f_out.close()
+                f_in = open_data(cut.src, 'r')
+                f_out = self.open_output(cut, 'w', False)
+
+                for i in range(0, first):
+                    f_in.readline()
+                for i in range(first, stop):
+                    line = f_in.readline()
+                    line = line.replace(str(i), str(i-first), 1)
+                    f_out.write(line)
+
+                bytes_read = stream_position(f_in)
+                f_in.close()
+            return self.close_output(cut, f_out, usage, bytes_read, stop, stop - first)
+
+    def cut_copy(self, cut):
+        """ The whole file unchanged. """
+        with tracer.span('cut_' + cut.key):
+            usage = Usage()
+            method = clone_file(cut.src, cut.dst, link=self.link_unchanged)
+            size = os.path.getsize(cut.dst)
+            return cut.dst, [], dict(usage.stop(), input_bytes=size, output_bytes=size, rows_read=0, rows_written=0,
+                                     method=method)
+
+
+class StreamCut(collections.namedtuple('StreamCut',
+                                        'key src dst start end min_canidx max_canidx sync_offset data_format')):
+    """ One data stream of a segment: frames [start, end] of the cut list line, the CAN index range
+    [min_canidx, max_canidx] of those frames, the byte offset of the first frame's sync row and the format the
+    cut is written in. """
+
+
+def step_metrics(usage, input_bytes, outputdata_file, rows_read, rows_written):
+    return dict(usage.stop(), input_bytes=input_bytes, output_bytes=os.path.getsize(outputdata_file),
+                rows_read=rows_read, rows_written=rows_written)
@@ -0,0 +1,650 @@
+import os
+import io
+import sys
+import json
+import shutil
+import errno
+import mmap
+import queue
+import threading
+import gzip
+import bz2
+import lzma
+import struct
+import hashlib
+import tempfile
+from array import array
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from profiling import tracer
+
+
+FICLONE = 0x40049409 # linux/fs.h, _IOW(0x94, 9, int)
+CHUNK = 1 << 20
+COMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+# Compressed streams ##########################################################################
+###############################################################################################
+
+class PrefetchReader(io.RawIOBase):
+    """ Raw stream of a compressed file decompressed on a background thread, a few chunks ahead of the reader
+    (zlib, bz2 and lzma release the GIL while they work). """
+
+    def __init__(self, filename, opener, depth=8):
+        self.queue = queue.Queue(depth)
+        self.pending = memoryview(b'')
+        self.position = 0
+        self.eof = False
+        self.closing = threading.Event()
+        threading.Thread(target=self.run, args=(filename, opener), daemon=True).start()
+
+    def run(self, filename, opener):
+        try:
+            with opener(filename, 'rb') as fp:
+                while not self.closing.is_set():
+                    data = fp.read(CHUNK)
+                    self.put(data)
+                    if not data:
+                        return
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        while not self.closing.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            if self.eof:
+                return 0
+            item = self.queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self.eof = True
+                return 0
+            self.pending = memoryview(item)
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        self.position += n
+        return n
+
+    def close(self):
+        self.closing.set()
+        super().close()
+
+
+def is_compressed(filename):
+    return os.path.splitext(filename)[1] in COMPRESSORS
+
+
+def open_data(filename, mode='r'):
+    """ open() for data files: .gz/.bz2/.xz files are read as streams decompressed in the background and written
+    compressed. Compressed streams aren't seekable. A file opened for writing is created anew (unlink_output). """
+    opener = COMPRESSORS.get(os.path.splitext(filename)[1])
+    if 'w' in mode:
+        unlink_output(filename)
+    if opener is None:
+        return open(filename, mode)
+    if 'r' in mode:
+        stream = io.BufferedReader(PrefetchReader(filename, opener))
+        return stream if 'b' in mode else io.TextIOWrapper(stream)
+    return opener(filename, mode if 'b' in mode else mode + 't')
+
+
+def stream_position(fp):
+    """ Bytes read so far from a file opened by open_data(), decompressed bytes for compressed files. """
+    raw = getattr(getattr(fp, 'buffer', fp), 'raw', None)
+    return raw.position if isinstance(raw, PrefetchReader) else fp.tell()
+
+
+# Byte ranges #################################################################################
+###############################################################################################
+
+def copy_range(src_fd, dst_fd, offset, length):
+    """ Copies `length` bytes at `offset` of src to the current position of dst. Stays in the kernel where possible
+    (copy_file_range, which also reflinks on copy-on-write filesystems, then sendfile), read/write otherwise. """
+    end = offset + length
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < end:
+                n = os.copy_file_range(src_fd, dst_fd, end - offset, offset)
+                if n == 0:
+                    return
+                offset += n
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF):
+                raise
+    if hasattr(os, 'sendfile'):
+        try:
+            while offset < end:
+                n = os.sendfile(dst_fd, src_fd, offset, end - offset)
+                if n == 0:
+                    return
+                offset += n
+            return
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF):
+                raise
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    while offset < end:
+        data = os.read(src_fd, min(CHUNK, end - offset))
+        if not data:
+            return
+        os.write(dst_fd, data)
+        offset += len(data)
+
+
+def unlink_output(filename):
+    """ Removes an existing output before it's written, it may be a hardlink of its recording (--hardlink) that
+    writing in place would change too. """
+    if os.path.lexists(filename):
+        os.remove(filename)
+
+
+def clone_file(src, dst, link=False):
+    """ Copies a file that needs no changes. Hardlinks it if `link` (the copy then shares the source's inode, so
+    only for outputs that are never modified in place), else reflinks it on copy-on-write filesystems, else
+    copies it in the kernel. Returns the method that worked, 'same' if dst is src. """
+    if os.path.realpath(src) == os.path.realpath(dst):
+        return 'same'
+    # a hardlink of src from an earlier --hardlink run would be truncated with src
+    unlink_output(dst)
+    if link:
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError:
+            pass
+
+    with open(src, 'rb') as f_in, open(dst, 'wb') as f_out:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(f_out.fileno(), FICLONE, f_in.fileno())
+                return 'reflink'
+            except OSError:
+                pass
+        copy_range(f_in.fileno(), f_out.fileno(), 0, os.fstat(f_in.fileno()).st_size)
+    return 'copy'
+
+
+# Line slicing ################################################################################
+###############################################################################################
+
+def line_offset(mm, line, start=0):
+    """ Byte offset of the `line`-th line after offset `start`, len(mm) if the file is shorter. """
+    pos = start
+    for _ in range(line):
+        nl = mm.find(b'\n', pos)
+        if nl == -1:
+            return len(mm)
+        pos = nl + 1
+    return pos
+
+
+def rewrite_first_column(src, f_out, first, stop, shift):
+    """ Writes lines [first, stop) of src into the binary file f_out with their leading index i renumbered to
+    i - shift, the rest of every line is copied as is from a memory map.
+
+    Byte-identical to reading and writing both files in text mode and doing line.replace(str(i), str(i-shift), 1),
+    which is what it replaces. Returns the number of source bytes read, or None without writing anything if the
+    source can't be mapped (compressed) or text mode would translate line endings (\\r in the source, or a platform
+    line separator other than \\n). """
+    if os.linesep != '\n' or is_compressed(src):
+        return None
+
+    with open(src, 'rb') as f_in:
+        if os.fstat(f_in.fileno()).st_size == 0:
+            return 0
+        mm = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if mm.find(b'\r') != -1:
+                return None
+
+            size = len(mm)
+            pos = line_offset(mm, first)
+            parts = []
+            for i in range(first, stop):
+                if pos >= size:
+                    break
+                nl = mm.find(b'\n', pos)
+                end = size if nl == -1 else nl + 1
+                key = b'%d' % i
+                if mm[pos:pos+len(key)] == key:
+                    parts.append(b'%d' % (i - shift))
+                    parts.append(mm[pos+len(key):end])
+                else:
+                    parts.append(mm[pos:end].replace(key, b'%d' % (i - shift), 1))
+                pos = end
+                if len(parts) >= 8192:
+                    f_out.writelines(parts)
+                    parts = []
+            f_out.writelines(parts)
+            return pos
+        finally:
+            mm.close()
+
+
+build_locks = {}
+build_locks_lock = threading.Lock()
+
+
+def build_lock(data_file):
+    """ Serialises building the derived files of a data file between the jobs of this process. """
+    with build_locks_lock:
+        return build_locks.setdefault(os.path.abspath(data_file), threading.Lock())
+
+
+def cache_paths(data_file, suffix):
+    """ Where derived files of a data file go: next to it, or in the temp directory if that isn't writable. """
+    return [data_file + suffix, os.path.join(tempfile.gettempdir(), 'ffcutter-cache',
+            hashlib.sha1(os.path.abspath(data_file).encode()).hexdigest() + suffix)]
+
+
+# Frame to CAN index table ####################################################################
+###############################################################################################
+
+class CanTable(object):
+    """ Binary lookup table of a sync file: per frame (data row) the byte offset of its row and the smallest and
+    largest positive CAN index in it, as three little-endian int64. Built once per recording and stored next to
+    the sync file (or in the temp directory if that isn't writable), rebuilt when the sync file's size or mtime
+    changes. """
+
+    MAGIC = b'FFCCAN01'
+    HEADER = struct.Struct('<8sQqQ') # magic, sync size, sync mtime_ns, rows
+    ROW = struct.Struct('<qqq') # row offset, min, max (0: no positive index)
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as fp:
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.rows = self.HEADER.unpack_from(self.mm)[3]
+
+    @classmethod
+    def open(cls, sync_file):
+        with build_lock(sync_file):
+            return cls.open_or_build(sync_file)
+
+    @classmethod
+    def open_or_build(cls, sync_file):
+        stat = os.stat(sync_file)
+        header = cls.HEADER.pack(cls.MAGIC, stat.st_size, stat.st_mtime_ns, 0)[:-8]
+        candidates = cache_paths(sync_file, '.canidx')
+
+        for filename in candidates:
+            try:
+                with open(filename, 'rb') as fp:
+                    if fp.read(len(header)) == header:
+                        return cls(filename)
+            except OSError:
+                pass
+
+        with tracer.span('can_table'):
+            table = cls.build(sync_file)
+        for filename in candidates:
+            tmp = None
+            try:
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                # a name of its own, other processes may build the same table
+                fd, tmp = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(filename) + '.',
+                                           dir=os.path.dirname(filename))
+                with os.fdopen(fd, 'wb') as fp:
+                    fp.write(cls.HEADER.pack(cls.MAGIC, stat.st_size, stat.st_mtime_ns, len(table) // 3))
+                    table.tofile(fp)
+                os.replace(tmp, filename)
+                return cls(filename)
+            except OSError:
+                if tmp is not None and os.path.exists(tmp):
+                    os.remove(tmp)
+        raise OSError('Can\'t write the CAN index table of %s' % sync_file)
+
+    @staticmethod
+    def build(sync_file):
+        table = array('q')
+        with open_data(sync_file, 'rb') as fp:
+            offset = len(fp.readline())
+            for line in fp:
+                lo = hi = 0
+                for field in line.split(b',')[2:]:
+                    try:
+                        x = int(field)
+                    except ValueError:
+                        continue
+                    if x > 0:
+                        lo = x if lo == 0 else min(lo, x)
+                        hi = max(hi, x)
+                table.extend((offset, lo, hi))
+                offset += len(line)
+        if sys.byteorder != 'little':
+            table.byteswap()
+        return table
+
+    def row(self, frame):
+        if not 0 <= frame < self.rows:
+            raise IndexError('Frame %d is outside of the sync file (%d rows)' % (frame, self.rows))
+        return self.ROW.unpack_from(self.mm, self.HEADER.size + frame * self.ROW.size)
+
+    def offset(self, frame):
+        return self.row(frame)[0]
+
+    def can_range(self, start, end):
+        """ (min_canidx, max_canidx) of the 1-based frame range [start, end] of a cut list line: the positive CAN
+        indexes of the first frame minus one and of the last frame. """
+        lo = self.row(start-1)[1]
+        hi = self.row(end-1)[2]
+        if lo == 0 or hi == 0:
+            raise ValueError('No positive CAN index in frame %d or %d' % (start, end))
+        return lo - 1, hi
+
+    def close(self):
+        self.mm.close()
+
+
+# Columnar cache ##############################################################################
+###############################################################################################
+
+class ColumnCache(object):
+    """ Columnar copy of a comma separated data file for repeated cuts and analysis: one .npy per column plus
+    meta.json, in a directory next to the file (or in the temp directory), rebuilt when the file's size or mtime
+    changes. Needs numpy.
+
+    A column whose tokens are all integers written the same way (same leading whitespace, no '+' or leading zeros)
+    is int64, any other column keeps its raw bytes, so line() rebuilds the file byte for byte. Files that don't fit
+    (ragged rows, mixed line endings, lone \\r) are remembered as unsupported and open() returns None. """
+
+    VERSION = 1
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.rows = meta['rows']
+        self.header = meta['header'].encode('latin-1')
+        self.prefixes = [c['prefix'] for c in meta['columns']]
+        self.columns = [numpy.load(os.path.join(path, c['file']), mmap_mode='r') for c in meta['columns']]
+
+    @classmethod
+    def open(cls, data_file, header=True):
+        if numpy is None:
+            return None
+        with build_lock(data_file):
+            return cls.open_or_build(data_file, header)
+
+    @classmethod
+    def open_or_build(cls, data_file, header):
+        stat = os.stat(data_file)
+        key = {'version': cls.VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'header': header}
+        candidates = cache_paths(data_file, '.columns')
+
+        for path in candidates:
+            try:
+                with open(os.path.join(path, 'meta.json')) as fp:
+                    meta = json.load(fp)
+            except (OSError, ValueError):
+                continue
+            if meta['key'] == key:
+                return cls(path, meta) if meta['columns'] is not None else None
+
+        with tracer.span('column_cache'):
+            meta, columns = cls.build(data_file, header)
+        meta['key'] = key
+        for path in candidates:
+            try:
+                cls.save(path, meta, columns)
+            except OSError:
+                continue
+            return cls(path, meta) if meta['columns'] is not None else None
+
+    @staticmethod
+    def build(data_file, header):
+        with open_data(data_file, 'rb') as fp:
+            head = fp.readline() if header else b''
+            lines = fp.read().split(b'\n')
+        meta = {'header': head.decode('latin-1'), 'columns': None, 'rows': 0}
+
+        final_newline = lines[-1] == b''
+        if final_newline:
+            lines.pop()
+        crlf = bool(lines) and lines[0].endswith(b'\r')
+        if crlf:
+            # a line without the \r gets a \n, which fails the check below
+            lines = [line[:-1] if line.endswith(b'\r') else line + b'\n' for line in lines]
+        if not lines or any(b'\r' in line or b'\n' in line for line in lines):
+            return meta, None
+        rows = [line.split(b',') for line in lines]
+        width = len(rows[0])
+        if any(len(row) != width for row in rows):
+            return meta, None
+
+        columns = []
+        meta['columns'] = []
+        for k, tokens in enumerate(zip(*rows)):
+            array, prefix = column(tokens)
+            columns.append(array)
+            meta['columns'].append({'file': '%d.npy' % k, 'dtype': array.dtype.str,
+                                    'prefix': prefix.decode('latin-1') if prefix is not None else None})
+        meta.update(rows=len(rows), line_ending='\r\n' if crlf else '\n', final_newline=final_newline)
+        return meta, columns
+
+    @staticmethod
+    def save(path, meta, columns):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a directory of its own, other processes may build the same cache
+        tmp = tempfile.mkdtemp(suffix='.tmp', prefix=os.path.basename(path) + '.', dir=os.path.dirname(path))
+        try:
+            for k, array in enumerate(columns or []):
+                numpy.save(os.path.join(tmp, '%d.npy' % k), array)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as fp:
+                json.dump(meta, fp)
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def is_int(self, k):
+        return self.prefixes[k] is not None
+
+    def token(self, k, row):
+        value = self.columns[k][row]
+        if self.is_int(k):
+            return self.prefixes[k].encode('latin-1') + b'%d' % value
+        return bytes(value)
+
+    def line(self, row):
+        """ Row `row` as it is in the file, line ending included. """
+        line = b','.join(self.token(k, row) for k in range(len(self.columns)))
+        if row < self.rows - 1 or self.meta['final_newline']:
+            line += self.meta['line_ending'].encode()
+        return line
+
+
+def column(tokens):
+    """ (int64 array, common prefix) if the tokens round-trip as integers, else (raw bytes array, None). """
+    first = tokens[0]
+    prefix = first[:len(first) - len(first.lstrip(b' '))]
+    try:
+        values = [int(t) for t in tokens]
+        if all(t == prefix + b'%d' % v for t, v in zip(tokens, values)):
+            return numpy.array(values, dtype=numpy.int64), prefix
+    except (ValueError, OverflowError):
+        pass
+    return numpy.array(tokens, dtype=bytes), None
+
+
+def cut_sync_rows(cache, start, end, min_canidx):
+    """ Rows [start-1, end) of a cached sync file as written by save_data_file: index renumbered from 0, time as
+    is, positive CAN indexes shifted by -min_canidx. Returns None if the cache can't reproduce the text path,
+    i.e. the index column isn't the plain row number or a CAN column isn't integer. """
+    a, b = start - 1, end
+    if (len(cache.columns) < 3 or not all(cache.is_int(k) for k in range(2, len(cache.columns))) or
+            cache.prefixes[0] != '' or not 0 <= a < b <= cache.rows or
+            not (cache.columns[0][a:b] == numpy.arange(a, b)).all()):
+        return None
+
+    data = numpy.stack([values[a:b] for values in cache.columns[2:]], axis=1)
+    data = numpy.where(data > 0, data - min_canidx, data)
+    times = [cache.token(1, row).decode() for row in range(a, b)]
+    return ['%d, %s, %s\n' % (i, t, ', '.join(map(str, row))) for i, (t, row) in enumerate(zip(times, data.tolist()))]
+
+
+# Output formats ##############################################################################
+###############################################################################################
+
+DATA_FORMATS = ('text', 'npy', 'npz', 'bin')
+
+
+# rows per block when the typed columns are interleaved into npy/bin records
+TABLE_ROWS = 1 << 16
+
+
+class ConversionError(ValueError):
+    """ A cut that can't be written in a binary data format: ragged rows or a column that isn't numeric. """
+
+
+class TableWriter(object):
+    """ Writes comma separated lines (str or bytes, a header line naming the columns first if `header`) as the
+    binary data format fmt under filename with the extension fmt. The lines are parsed in chunks of about CHUNK
+    bytes as they are written and appended to one typed array per column, the text is never kept whole.
+
+    Integer columns are little-endian int64, a column switches to float64 at its first token that isn't an
+    integer. The layout, 'name:<i8,name:<f8,...', is the numpy dtype of a row: 'npy' is one structured array of it
+    (np.load(..., mmap_mode='r')), 'bin' the same rows as raw fixed-width records without a header
+    (np.memmap(..., dtype=...)), 'npz' one array per column (zip compressed if `compress`). Columns are named by the
+    header line, or col0, col1, ...
+
+    write() and finish() raise ConversionError for ragged rows or a column that isn't numeric, nothing is written
+    before finish(). close() drops a table that isn't finished. """
+
+    def __init__(self, filename, fmt, header, compress=False):
+        if fmt in ('npy', 'npz') and numpy is None:
+            raise RuntimeError('The %s data format needs numpy.' % fmt)
+        self.dst = os.path.splitext(filename)[0] + '.' + fmt
+        self.fmt = fmt
+        self.header = header
+        self.compress = compress
+        self.names = None
+        self.columns = None
+        self.rows = 0
+        self.pending = [] # text after the last complete line
+        self.pending_size = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= CHUNK:
+            self.parse(final=False)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def parse(self, final):
+        data = b''.join(self.pending)
+        rest = b''
+        if not final:
+            end = data.rfind(b'\n') + 1
+            data, rest = data[:end], data[end:]
+        self.pending = [rest] if rest else []
+        self.pending_size = len(rest)
+
+        lines = iter(data.splitlines())
+        if self.header and self.names is None:
+            first = next(lines, None)
+            if first is None:
+                return
+            self.names = [name.strip().decode() for name in first.split(b',')]
+        rows = [line.split(b',') for line in lines if line.strip()]
+        if not rows:
+            return
+        if self.columns is None:
+            self.names = self.names or ['col%d' % k for k in range(len(rows[0]))]
+            self.columns = [array('q') for _ in self.names]
+        if any(len(row) != len(self.names) for row in rows):
+            raise ConversionError('Rows of different lengths')
+        for k, tokens in enumerate(zip(*rows)):
+            self.columns[k] = extend_column(self.names[k], self.columns[k], tokens)
+        self.rows += len(rows)
+
+    def finish(self):
+        """ Writes the table, returns (filename, layout). """
+        self.parse(final=True)
+        names = self.names or []
+        columns = self.columns or [array('q') for _ in names]
+        fields = [(name, '<i8' if values.typecode == 'q' else '<f8', values) for name, values in zip(names, columns)]
+        layout = ','.join('%s:%s' % (name, code) for name, code, _ in fields)
+        unlink_output(self.dst)
+
+        if self.fmt == 'npz':
+            arrays = {name: numpy.frombuffer(values, dtype=code[1:]) for name, code, values in fields}
+            (numpy.savez_compressed if self.compress else numpy.savez)(self.dst, **arrays)
+        elif numpy is not None:
+            dtype = numpy.dtype([(name, code) for name, code, _ in fields])
+            with open(self.dst, 'wb') as fp:
+                if self.fmt == 'npy':
+                    header = {'descr': numpy.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                              'shape': (self.rows,)}
+                    try:
+                        numpy.lib.format.write_array_header_1_0(fp, header)
+                    except ValueError: # header too long for format 1.0, as numpy.save does
+                        numpy.lib.format.write_array_header_2_0(fp, header)
+                for a in range(0, self.rows, TABLE_ROWS):
+                    b = min(a + TABLE_ROWS, self.rows)
+                    table = numpy.empty(b - a, dtype=dtype)
+                    for name, code, values in fields:
+                        table[name] = numpy.frombuffer(values, dtype=code[1:])[a:b]
+                    table.tofile(fp)
+        else:
+            record = struct.Struct('<' + ''.join(values.typecode for _, _, values in fields))
+            with open(self.dst, 'wb') as fp:
+                for row in zip(*(values for _, _, values in fields)):
+                    fp.write(record.pack(*row))
+        self.close()
+        return self.dst, layout
+
+    def close(self):
+        self.pending = []
+        self.columns = None
+
+
+def extend_column(name, values, tokens):
+    """ values (array 'q' or 'd') with the tokens appended, converted to 'd' if a token isn't an integer. """
+    if values.typecode == 'q':
+        try:
+            values.extend(array('q', map(int, tokens)))
+            return values
+        except (ValueError, OverflowError):
+            values = array('d', values)
+    try:
+        values.extend(array('d', map(float, tokens)))
+    except ValueError:
+        bad = next(t for t in tokens if not is_float(t))
+        raise ConversionError('Column "%s" has the non-numeric value "%s"' % (name, bad.strip().decode('latin-1')))
+    return values
+
+
+def is_float(token):
+    try:
+        float(token)
+        return True
+    except ValueError:
+        return False
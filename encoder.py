@@ -0,0 +1,230 @@
+import os
+import bisect
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import ProcessPool
+from probe import fingerprint
+
+
+def filter_graph(segments, video='0:v', audio='0:a', join=False):
+    """ A filter_complex that decodes the input once and trims every segment out of it with trim/atrim.
+    video and audio are the input streams (None for none, at least one of them). Returns the graph and the output
+    labels, one (video, audio) pair per segment or a single pair if the segments are joined with concat. Labels of
+    a missing stream are None. """
+    count = len(segments)
+    chains = []
+    if video:
+        chains.append('[%s]split=%d%s' % (video, count, ''.join('[vin%d]' % i for i in range(count))))
+    if audio:
+        chains.append('[%s]asplit=%d%s' % (audio, count, ''.join('[ain%d]' % i for i in range(count))))
+
+    outputs = []
+    for i, (a, b) in enumerate(segments):
+        if video:
+            chains.append('[vin%d]trim=start=%.6f:end=%.6f,setpts=PTS-STARTPTS[v%d]' % (i, a, b, i))
+        if audio:
+            chains.append('[ain%d]atrim=start=%.6f:end=%.6f,asetpts=PTS-STARTPTS[a%d]' % (i, a, b, i))
+        outputs.append(('[v%d]' % i if video else None, '[a%d]' % i if audio else None))
+
+    if join and count > 1:
+        inputs = ''.join((v or '') + (a or '') for v, a in outputs)
+        chains.append('%sconcat=n=%d:v=%d:a=%d%s%s' % (inputs, count, int(bool(video)), int(bool(audio)),
+                                                      '[vout]' if video else '', '[aout]' if audio else ''))
+        outputs = [('[vout]' if video else None, '[aout]' if audio else None)]
+
+    return ';'.join(chains), outputs
+
+
+def make_encode_command(ffmpeg, filename, segments, outfiles, inargs=(), outargs=(), video='0:v', audio='0:a',
+                        join=False):
+    """ One ffmpeg command that encodes all segments in a single decode of the input, into one file per segment or,
+    joined, into outfiles[0]. """
+    graph, outputs = filter_graph(segments, video, audio, join)
+    command = [ffmpeg] + list(inargs) + ['-i', filename, '-y', '-filter_complex', graph]
+    for labels, outfile in zip(outputs, outfiles):
+        for label in labels:
+            if label:
+                command += ['-map', label]
+        command += list(outargs) + [outfile]
+    return command
+
+
+# Parallel encoding ###########################################################################
+###############################################################################################
+
+def split_at_keyframes(segments, ipts, parts):
+    """ Splits the segments into chunks of about 1/parts of their total length, cutting long segments at
+    keyframes. Returns [(segment index, start, end)]. """
+    total = sum(b - a for a, b in segments)
+    target = total / max(parts, 1)
+    chunks = []
+    for i, (a, b) in enumerate(segments):
+        pos = a
+        while target and b - pos > target * 1.5:
+            k = bisect.bisect_left(ipts, pos + target)
+            if k >= len(ipts) or b - ipts[k] < target / 2:
+                break
+            chunks.append((i, pos, float(ipts[k])))
+            pos = float(ipts[k])
+        chunks.append((i, pos, b))
+    return chunks
+
+
+# options that only change the second pass, the first pass stats stay valid for any value of them
+SECOND_PASS_OPTIONS = {'-b', '-b:v', '-maxrate', '-maxrate:v', '-minrate', '-minrate:v', '-bufsize', '-bufsize:v'}
+
+
+def first_pass_args(args):
+    args = list(args)
+    kept = []
+    while args:
+        arg = args.pop(0)
+        if arg in SECOND_PASS_OPTIONS:
+            args = args[1:]
+        else:
+            kept.append(arg)
+    return kept
+
+
+def stats_key(filename, start, end, inargs, outargs):
+    """ Names the first pass stats of a chunk: input version, chunk and the arguments that affect the first pass. """
+    key = repr((fingerprint(filename), '%.6f' % start, '%.6f' % end, list(inargs), first_pass_args(outargs)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def write_concat_list(filename, files):
+    with open(filename, 'w', encoding='utf-8') as fp:
+        fp.write('ffconcat version 1.0\n')
+        for f in files:
+            fp.write("file '%s'\n" % os.path.abspath(f).replace("'", "'\\''"))
+
+
+class ParallelEncoder(ProcessPool):
+    """ Encodes the segments of a plan with `jobs` ffmpeg processes at once. Long segments are cut at keyframes
+    into chunks so every worker gets a similar share; each chunk is encoded with the same arguments from an input
+    seek to its start, and the chunks of an output are joined losslessly with the concat demuxer.
+
+    With a `stats_dir` every chunk is encoded in two passes. The first pass stats are kept there, named after the
+    input, the chunk and the arguments except the bitrate ones, so encoding the same plan again at another bitrate
+    skips the first passes. """
+
+    def __init__(self, ffmpeg, filename, segments, outfiles, ipts, jobs=1, inargs=(), outargs=(), join=False,
+                 log=print, log_error=print, stats_dir=None):
+        super().__init__(jobs, log, log_error)
+        self.stats_dir = stats_dir # two-pass encoding if given
+        self.ffmpeg = ffmpeg
+        self.filename = filename
+        self.inargs = list(inargs)
+        self.outargs = list(outargs)
+        self.outfiles = outfiles
+        self.join = join
+        self.chunks = split_at_keyframes(segments, ipts, jobs)
+        output_dir = os.path.dirname(os.path.abspath(outfiles[0]))
+        self.staging = os.path.join(output_dir, '.ffcutter-chunks-%d' % os.getpid())
+        ext = os.path.splitext(outfiles[0])[1]
+        self.chunk_files = [os.path.join(self.staging, 'chunk%05d%s' % (n, ext)) for n in range(len(self.chunks))]
+
+    def chunk_command(self, n, passes=()):
+        _i, a, b = self.chunks[n]
+        return ([self.ffmpeg] + self.inargs + ['-ss', '%.6f' % a, '-i', self.filename, '-t', '%.6f' % (b - a),
+                '-y'] + self.outargs + list(passes) + [self.chunk_files[n]])
+
+    def stats_prefix(self, n):
+        _i, a, b = self.chunks[n]
+        return os.path.join(self.stats_dir, 'pass-' + stats_key(self.filename, a, b, self.inargs, self.outargs))
+
+    def has_stats(self, n):
+        return os.path.exists(self.stats_prefix(n) + '-0.log')
+
+    def first_pass_command(self, n, prefix):
+        _i, a, b = self.chunks[n]
+        return ([self.ffmpeg] + self.inargs + ['-ss', '%.6f' % a, '-i', self.filename, '-t', '%.6f' % (b - a),
+                '-y'] + first_pass_args(self.outargs) + ['-pass', '1', '-passlogfile', prefix, '-an', '-f', 'null',
+                os.devnull])
+
+    def second_pass_command(self, n):
+        return self.chunk_command(n, ['-pass', '2', '-passlogfile', self.stats_prefix(n)])
+
+    def run_first_pass(self, n):
+        """ Writes the stats under a temporary prefix and renames them, an interrupted pass leaves no stats. """
+        prefix = self.stats_prefix(n)
+        tmp_prefix = '%s.tmp%d' % (prefix, os.getpid())
+        code = self.run_process(self.first_pass_command(n, tmp_prefix))
+        tmp_dir, tmp_name = os.path.split(tmp_prefix)
+        for name in os.listdir(tmp_dir):
+            if name.startswith(tmp_name):
+                tmp = os.path.join(tmp_dir, name)
+                if code == 0:
+                    os.replace(tmp, prefix + name[len(tmp_name):])
+                else:
+                    os.remove(tmp)
+        return code
+
+    def outputs(self):
+        """ [(output file, its chunk files)] """
+        if self.join:
+            return [(self.outfiles[0], self.chunk_files)]
+        files = [[] for _ in self.outfiles]
+        for (i, _a, _b), chunk_file in zip(self.chunks, self.chunk_files):
+            files[i].append(chunk_file)
+        return list(zip(self.outfiles, files))
+
+    def concat_command(self, outfile, list_file):
+        return [self.ffmpeg, '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_file, '-c', 'copy', '-y', outfile]
+
+    def chunk_commands(self, n):
+        if self.stats_dir is None:
+            return [self.chunk_command(n)]
+        if self.has_stats(n):
+            return [self.second_pass_command(n)]
+        return [self.first_pass_command(n, self.stats_prefix(n)), self.second_pass_command(n)]
+
+    @property
+    def commands(self):
+        commands = [cmd for n in range(len(self.chunks)) for cmd in self.chunk_commands(n)]
+        for n, (outfile, files) in enumerate(self.outputs()):
+            if len(files) > 1:
+                commands.append(self.concat_command(outfile, os.path.join(self.staging, 'concat%d.txt' % n)))
+        return commands
+
+    def run(self):
+        """ Returns the exit code of the first failed process, 0 on success. """
+        outputs = self.outputs()
+        if self.stats_dir is not None:
+            os.makedirs(self.stats_dir, exist_ok=True)
+        self.total = (sum(len(self.chunk_commands(n)) for n in range(len(self.chunks))) +
+                      sum(1 for _, files in outputs if len(files) > 1))
+        os.makedirs(self.staging, exist_ok=True)
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                codes = list(pool.map(self.run_chunk, range(len(self.chunks))))
+            code = next((code for code in codes if code != 0), 0)
+            if code != 0:
+                return code if code is not None else 1
+            for n, (outfile, files) in enumerate(outputs):
+                if len(files) == 1:
+                    os.replace(files[0], outfile)
+                    continue
+                list_file = os.path.join(self.staging, 'concat%d.txt' % n)
+                write_concat_list(list_file, files)
+                code = self.run_process(self.concat_command(outfile, list_file))
+                if code != 0:
+                    return code if code is not None else 1
+            return 0
+        finally:
+            shutil.rmtree(self.staging, ignore_errors=True)
+
+    def run_chunk(self, n):
+        if self.failed or self.interrupted:
+            return None
+        if self.stats_dir is None:
+            code = self.run_process(self.chunk_command(n))
+        else:
+            code = 0 if self.has_stats(n) else self.run_first_pass(n)
+            if code == 0:
+                code = self.run_process(self.second_pass_command(n))
+        if code != 0:
+            self.failed = True
+        return code
@@ -6,41 +6,88 @@ import re
 import signal
 import locale
 import subprocess
-import collections
 import tempfile
 import shutil
 import json
 import hashlib
+import threading
+import time
+from array import array
 
-import colorama
 from docopt import docopt
-from PyQt5 import QtGui, QtCore, QtWidgets
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QFileDialog
 
-from mpv import MPV
-from gui import Ui_main, Ui_shiftDialog
+import subcommands
 
 
 doc = """ffcutter
 
 Usage:
-    ffcutter
-    ffcutter <video-file> [-s <save-file> --mpv=mpv-option...]
+    ffcutter report <metrics-file>
+    ffcutter materialize <playlist>...
+    ffcutter plan <cut-list> [--jobs=<n> --metrics=<metrics-file>]
+    ffcutter serve --watch=<dir> [--jobs=<n> --poll=<seconds> --streams=<selection> --metrics=<metrics-file>]
+    ffcutter [--profile --trace=<trace-file> --metrics=<metrics-file>]
+    ffcutter <video-file> [-s <save-file> --preload-next --review --hardlink --column-cache --data-format=<format> --compress=<codec> --stream=<key:kind>... --streams=<selection> --jobs=<n> --profile --trace=<trace-file> --metrics=<metrics-file> --mpv=mpv-option...]
     ffcutter -h | --help
 
 Options:
     -s <save-file>          Specify save file. Default is "filename.ffcutter" inside working directory.
     -m --mpv mpv-option     Specify additional mpv option or change the default ones.
+    --preload-next          Preload the next file in the directory so switching to it (n key) is instant.
+    -r --review             Open cut lists (.txt, .csv, .jsonl) for review instead of running them right away.
+    --hardlink              Hardlink data files that are cut unchanged (cam_params) instead of copying them.
+                            Without it they are reflinked where the filesystem supports it.
+                            Hardlinked outputs share their inode with the recording: editing one in place
+                            changes the recording too (ffcutter replaces existing outputs instead).
+    --column-cache          Keep a columnar .npy copy of each sync file (built on the first cut, needs numpy)
+                            and cut from it, for recordings that are cut many times.
+    --data-format=<format>  Format of the cut sync and dgps_car files: text, npy, npz (need numpy) or bin
+                            (fixed-width little-endian records). metainfo.txt records the format and the
+                            row layout of each file; a file with a non-numeric column stays text.
+                            [default: text]
+    --compress=<codec>      Write the cut text files compressed: gz, bz2 or xz (npz: zip compressed, not
+                            with npy or bin).
+                            Compressed data files (.gz, .bz2, .xz) in recordings are always read as streams.
+    -j --jobs=<n>           Run this many lines of a cut list in parallel. Every line is cut into a staging
+                            directory and moved into its output directory when done, metainfo.txt is that
+                            of the last line of the directory, as in a sequential run. When encoding, the
+                            number of ffmpeg processes the segments are split across (at keyframes) and
+                            joined with the concat demuxer. [default: 1]
+    --stream=<key:kind>     How to cut the data file of a metainfo.txt key: row_range (one row per frame),
+                            can_range (one row per CAN index), sync or copy. Unknown keys are copied.
+    --watch=<dir>           Directory that `ffcutter serve` watches for new cut lists (.txt, .csv, .jsonl).
+                            They run on one persistent worker pool with warm probe/metainfo/sync caches,
+                            <list>.status.json next to a list tells its state; delete it to run the list again.
+    --poll=<seconds>        How often the watched directory is scanned. [default: 2]
+    --streams=<selection>   Copy only these streams of the videos instead of ffmpeg's default choice: stream
+                            indexes, types (v, a, s, d) or type:language, comma separated, e.g. "0,a:eng".
+                            A cut list line can override it with a trailing streams=<selection>, the
+                            arguments editor with a "streams:" line. Checked against the probed streams.
+    --trace=<trace-file>    Write timing spans of the cutting stages and ffmpeg/ffprobe processes into a
+                            Chrome trace file (chrome://tracing, ui.perfetto.dev).
+    --profile               Print a per-stage timing summary and the Python hot spots (cProfile) on exit.
+                            With --trace the cProfile stats are also saved next to the trace file (.prof).
+    --metrics=<metrics-file>
+                            Append one JSON line per ffmpeg job and data file cut (bytes, rows, wall and CPU
+                            time, peak RSS, exit code). `ffcutter report` summarizes it per input file and stage.
+                            `ffcutter plan` estimates run times from the throughputs measured in it.
 
 Examples:
     ffcutter ./movie.mkv
     ffcutter ./movie.mkv -s ./movie.mkv.ffcutter
     ffcutter ./movie.mkv -m hr-seek=yes -m wid=-1
+    ffcutter ./cuts.txt --trace=./cuts.trace.json --profile
+    ffcutter ./cuts.txt --metrics=./cuts.metrics.jsonl
+    ffcutter ./cuts.txt --stream=imu:row_range --data-format=npy
+    ffcutter report ./cuts.metrics.jsonl
+    ffcutter materialize ./movie.ffcutter.part250-900.m3u8
+    ffcutter plan ./cuts.txt --jobs=8 --metrics=./cuts.metrics.jsonl
+    ffcutter serve --watch=./incoming --jobs=8
 
 Default mpv options:
     wid=$wid
-    keep-open=yes
+    keep-open=always
+    prefetch-playlist=yes
     rebase-start-time=no
     framedrop=no
     osd-level=2
@@ -58,37 +105,195 @@ GUI keys:
 
     z - Put anchor on the current playback position.
     x - Remove highlighted anchor.
+    k - Toggle keyframe marks on the seekbar.
 
     h - Print this help message to the terminal.
     i - Print input file information to the terminal.
 
     ctrl + o - Open its directory.
+    n - Open the next file of the same type in its directory.
+    page up/down - Previous/next cut list entry in review mode.
 
     f - Input frame start/end shift which will be applied to all segments during encoding / stream copy.
 
 If program crashes try to rerun it (duh).
 """
 
+if __name__ == '__main__' and sys.argv[1:2] and sys.argv[1] in subcommands.COMMANDS:
+    # before Qt and libmpv are loaded, these also run on hosts without them
+    subcommands.run(docopt(doc))
+    sys.exit()
+
+import colorama
+from PyQt5 import QtGui, QtCore, QtWidgets
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QFileDialog
+
+from mpv import MPV, MpvEventID
+from gui import Ui_main, Ui_shiftDialog
+from cutter import Cutter
+from subcommands import find_binary
+from jobs import JobRunner
+from cutlist import CutList, CUT_LIST_EXTENSIONS
+from segmenter import SegmentSplit, SPLIT_MODES, prefer_split
+from encoder import make_encode_command, ParallelEncoder
+from probe import probe_streams, probe_keyframes, has_stream, select_streams
+from virtual import VIRTUAL_FORMATS, virtual_format, write_virtual_cut
+import datafiles
+from datafiles import DATA_FORMATS
+from frameindex import FrameIndex, dedupe_close, closest
+from profiling import tracer, traced, Session
+import metrics
+
 # TODO
 # handle keystrokes from terminal too
 # mpv keyframe/anchor jumps often fail, any way to fix that?
 # don't generate concat when just one segment
 
 
+class SeekController(object):
+    """ Keeps at most one seek in flight. Seeks requested while mpv is still busy replace the pending one,
+    so only the latest target is sent when the current seek finishes (latest wins). """
+
+    # give up waiting for a seek to finish after this many seconds
+    timeout = 1.0
+
+    def __init__(self, player):
+        self.player = player
+        self.lock = threading.Lock()
+        self.current = None
+        self.pending = None
+        self.started = 0
+        player.register_event_callback(self.on_event)
+
+    def seek(self, amount, reference='relative', precision='default-precise'):
+        self.request('seek', amount, reference, precision)
+
+    def frame_step(self):
+        self.request('frame_step')
+
+    def frame_back_step(self):
+        self.request('frame_back_step')
+
+    def request(self, *command):
+        with self.lock:
+            if self.current is not None and time.monotonic() - self.started < self.timeout:
+                self.pending = command
+                return
+            self.current = command
+            self.started = time.monotonic()
+        self.send(command)
+
+    def send(self, command):
+        # async, so neither key handling nor painting waits for libmpv
+        self.player.command_async(*command, callback=self.on_reply)
+
+    def done(self):
+        with self.lock:
+            command, self.pending = self.pending, None
+            self.current = command
+            self.started = time.monotonic()
+        if command is not None:
+            self.send(command)
+
+    def on_reply(self, future):
+        # a failed command never restarts playback
+        if future.exception() is not None:
+            self.done()
+
+    def on_event(self, devent):
+        # called from the mpv event thread
+        if devent['event_id'] == MpvEventID.PLAYBACK_RESTART:
+            self.done()
+
+    def on_position(self):
+        # frame_step doesn't restart playback, the next position update is its completion
+        if self.current is not None and self.current[0] == 'frame_step':
+            self.done()
+
+
+class PlayerPool(object):
+    """ A few MPV instances, each rendering into its own video widget, used to review cut lists. The upcoming
+    entries are kept loaded, paused and seeked to their start frame, so moving to the next one is instant. """
+
+    def __init__(self, gui, size):
+        self.gui = gui
+        self.slots = [] # [video widget, player, seeker, entry index]
+        for i in range(size):
+            video = QtWidgets.QWidget()
+            video.setFocusPolicy(QtCore.Qt.NoFocus)
+            video.setStyleSheet("background-color: rgb(117, 80, 123);")
+            video.setObjectName("video%d" % i)
+            video.hide()
+            gui.ui.horizontalLayout_3.insertWidget(i, video)
+            player, seeker = gui.init_player(video)
+            self.slots.append([video, player, seeker, None])
+
+    def load(self, slot, index):
+        start, _end, frame_duration, video_file = self.gui.get_review_entry(index)
+        slot[1].loadfile(video_file, start=str(start * frame_duration), pause='yes')
+        slot[3] = index
+
+    def show(self, index):
+        """ Shows the entry's slot, loading it if it wasn't prefetched, and prefetches the entries after it. """
+        wanted = range(index, index + len(self.slots))
+        slots = {slot[3]: slot for slot in self.slots}
+        if index not in slots:
+            free = [slot for slot in self.slots if slot[3] not in wanted]
+            self.load(free[0], index)
+
+        for slot in self.slots:
+            slot[0].setVisible(slot[3] == index)
+
+        for i in wanted[1:]:
+            if i >= len(self.gui.review_entries):
+                break
+            if i not in (slot[3] for slot in self.slots):
+                free = [slot for slot in self.slots if slot[3] not in wanted]
+                if not free:
+                    break
+                self.load(free[0], i)
+
+        return next(slot for slot in self.slots if slot[3] == index)
+
+    def terminate(self):
+        for slot in self.slots:
+            slot[1].terminate()
+        self.slots = []
+
+
 class GUI(QtWidgets.QDialog):
 
     statusbar_update = QtCore.pyqtSignal()
     player_loaded = QtCore.pyqtSignal()
-    frameindex_built = QtCore.pyqtSignal()
+    frameindex_built = QtCore.pyqtSignal(str, object)
     shell_message = QtCore.pyqtSignal(str)
 
-    def __init__(self, filename=None, save_filename=None, mpv_options=[], skip_index=False):
+    # number of players kept warm while reviewing a cut list
+    review_pool_size = 3
+
+    def __init__(self, filename=None, save_filename=None, mpv_options=[], skip_index=False, preload_next=False,
+                 review=False):
         super().__init__()
         self.filename = filename
         self.save_filename = save_filename
         self.mpv_options = mpv_options
+        self.preload_next = preload_next
+        self.review = review
+        self.player = None
+        self.main_player = None
+        self.preloaded = None
+        self.pool = None
+        self.review_entries = None
+        self.profiling = None
+        self.jobs = 1
+        self.split = None # SegmentSplit of the running plan
+        self.encoder = None # ParallelEncoder of the running plan
+        self.virtual_cuts = None # playlists planned instead of media
 
         self.initialize_ui()
+        if self.filename and self.review and os.path.splitext(self.filename)[1] in CUT_LIST_EXTENSIONS:
+            QtCore.QTimer.singleShot(0, self.review_text_file)
             
     def initialize_ui(self):
         self.segments = []
@@ -107,8 +312,9 @@ class GUI(QtWidgets.QDialog):
         self.show_keyframes = False
         self.running_ffmpeg = False
 
-        self.pts = []
-        self.ipts = []
+        self.frame_index = FrameIndex()
+        self.pts = self.frame_index.pts
+        self.ipts = self.frame_index.ipts
         self.ffmpeg_shift_a = 0
         self.ffmpeg_shift_b = 0
         
@@ -120,7 +326,10 @@ class GUI(QtWidgets.QDialog):
         self.setFocus(True)
         
         self.ui.print.clicked.connect(self.print_ffmpeg)
-        self.ui.run.clicked.connect(self.run_ffmpeg)
+        self.ui.run.clicked.connect(self.run_clicked)
+        self.player_loaded.connect(self.on_player_loaded)
+        self.frameindex_built.connect(self.on_frame_index_built)
+        self.ui.view.clicked.connect(self.review_item_selected)
         
         def open_file():
             fname = QFileDialog.getOpenFileName(self)
@@ -163,32 +372,17 @@ class GUI(QtWidgets.QDialog):
         self.show()
          
         # check if necessary binaries are present
-        self.ffmpeg_bin = 'ffmpeg'
-        self.ffprobe_bin = 'ffprobe'
         self.interrupted = False
-        
-        if getattr(sys, 'frozen', False):
-            dirname = os.path.split(sys.executable)[0]
-            self.ffmpeg_bin = os.path.join(dirname, 'ffmpeg.exe')
-            self.ffprobe_bin = os.path.join(dirname, 'ffprobe.exe')
-        elif os.name == 'nt':
-            dirname = os.path.split(__file__)[0]
-            self.ffmpeg_bin = os.path.join(dirname, 'ffmpeg.exe')
-            self.ffprobe_bin = os.path.join(dirname, 'ffprobe.exe')
-
-        
-        self.directory = getattr(sys, '_MEIPASS', os.path.abspath('.'))
-        self.ffmpeg_bin = os.path.join(self.directory, 'ffmpeg.exe')
-        self.ffprobe_bin = os.path.join(self.directory, 'ffprobe.exe')
-        print(self.directory)
-        
-        if not shutil.which(self.ffmpeg_bin):
+        self.ffmpeg_bin = find_binary('ffmpeg')
+        self.ffprobe_bin = find_binary('ffprobe')
+        if not self.ffmpeg_bin:
             self.print_error('FFmpeg weren\'t found.')
             self.ui.run.setEnabled(False)
-            self.ffmpeg_bin = None
-        if not shutil.which(self.ffprobe_bin):
+        if not self.ffprobe_bin:
             self.print_error('FFprobe weren\'t found. Wont be able to build frame index.')
-            self.ffprobe_bin = None    
+
+        self.cutter = Cutter(self.ffmpeg_bin, self.ffprobe_bin)
+        self.cutter.log_error = self.print_error
     
     
     # Read a file choosed #########################################################################
@@ -197,191 +391,154 @@ class GUI(QtWidgets.QDialog):
     def execute_file(self):
         self._, self.ext= os.path.splitext(self.filename)
                         
-        if self.ext == ".txt" :
+        if self.ext in CUT_LIST_EXTENSIONS and self.review:
+            self.review_text_file()
+        elif self.ext in CUT_LIST_EXTENSIONS :
             self.execute_text_file()
         else :
             self.load_file()   
-            
-    def execute_text_file(self):
-        self.scene_list = []
-        with open(self.filename, 'rb') as fp:
-            for line in fp:
-                self.scene_list.append(line.decode('utf-8'))
-        command_list = []
-        for i, line in enumerate(self.scene_list):
-            line_args = line.split()
-            line_args[2] = int(line_args[2])
-            line_args[3] = int(line_args[3])       
-            video_segment = [line_args[0], line_args[1], line_args[2], line_args[3]]
-            command_list.append(self.make_ffmpeg_command(video_segment))
-        
-        if not command_list == []:
-            self.run_ffmpeg(commands = command_list)
-        else :
-            print("Input file doesn't have a proper form")
-        
-        
-    def make_ffmpeg_command(self, video_segment):
-        input_file = video_segment[0]        
-        infile_name, ext = os.path.splitext(os.path.split(input_file)[1])
-        if ext == '' :
-            input_file = os.path.join(input_file ,self.get_infile_path(input_file))
-
-        cmd = [self.ffprobe_bin] + [' -v 0 -of csv=p=0 -select_streams v:0 -show_entries stream=r_frame_rate '] + [input_file]
-        cmd = "".join(map(str, cmd))
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-        cmdout, err = proc.communicate()
-        frame_duration = 1/float(eval(cmdout.decode("utf-8").rstrip()))
-        
-        outfile_path = video_segment[1]
-        if not os.path.exists(outfile_path):
-            os.mkdir(outfile_path)
-        
-        infile_name, _ext = os.path.splitext(os.path.split(input_file)[1])
-        start = video_segment[2]
-        end = video_segment[3]
-        tmpfile = '%s.part%d-%d%s' % (infile_name, start, end, _ext)
-        if ext == '':
-            self.save_data_file(video_segment, tmpfile)
-        tmpfile = os.path.join(outfile_path, tmpfile)
 
-            
+    @traced('execute_text_file')
+    def execute_text_file(self, filename=None):
+        # the list is read line by line while the jobs run
+        self.run_jobs(CutList(filename or self.filename, self.print_error))
         
+    # Review cut list #############################################################################
+    ###############################################################################################
 
-        ffmpeg = self.ffmpeg_bin or 'ffmpeg'
-        start = start*frame_duration 
-        end = end*frame_duration + frame_duration
+    def review_text_file(self):
+        self.review_filename = self.filename
+        self.review_entries = self.cutter.read_text_file(self.filename, self.print_error)
+        if not self.review_entries:
+            print("Input file doesn't have a proper form")
+            return
 
-        command = [ffmpeg, '-i', input_file, '-y', '-ss', str(start), '-to', str(end), '-c', 'copy', tmpfile]
-        
-        return command
-    
-    # Save data file ##############################################################################
-    ###############################################################################################
-    
-    def get_cmd_option(self, filename, option):
-        with open(filename, 'rb') as fp:
-            for line in fp:
-                line = line.decode()
-                if line.find(option) != -1 :
-                    line = line.replace(option, "", 1)
-                    line = line.replace("\r\n", "", 1)
-                    return line
-    
-    def get_infile_path(self, infile_path):
-        metainfo_file = os.path.join(infile_path, "metainfo.txt")
-        cam_filename = self.get_cmd_option(metainfo_file, "cam=")
-        return cam_filename
-    
-    def save_data_file(self, segment, video_filename):
-        infile_path = segment[0]
-        outfile_path = segment[1]
-        if not os.path.exists(outfile_path):
-            os.mkdir(outfile_path)
-        
-        start = segment[2]
-        end = segment[3]
-        
-        metainfo_file = os.path.join(infile_path, "metainfo.txt")
+        model = self.ui.model
+        model.removeRows(0, model.rowCount())
+        groups = {}
+        for i, (input_file, outfile_path, start, end, _options) in enumerate(self.review_entries):
+            if input_file not in groups:
+                groups[input_file] = QtGui.QStandardItem(input_file)
+                model.appendRow(groups[input_file])
+            child = QtGui.QStandardItem('%d-%d  %s' % (start, end, outfile_path))
+            child.setData(i, Qt.UserRole)
+            groups[input_file].appendRow(child)
+        self.ui.view.expandAll()
+        self.ui.view.show()
+        self.ui.video.hide()
+        if self.main_player is not None:
+            self.main_player[0].pause = True
+
+        if self.pool is None:
+            self.pool = PlayerPool(self, self.review_pool_size)
+            QtWidgets.QApplication.instance().aboutToQuit.connect(self.pool.terminate)
+        for slot in self.pool.slots:
+            slot[3] = None
+        self.select_review_entry(0)
+
+    def get_review_entry(self, index):
+        input_file, _outfile_path, start, end, _options = self.review_entries[index]
+        video_file = self.cutter.get_input_video(input_file)
+        return start, end, self.cutter.get_frame_duration(video_file), video_file
+
+    def select_review_entry(self, index):
+        index = min(max(index, 0), len(self.review_entries) - 1)
+        model = self.ui.model
+        for row in range(model.rowCount()):
+            group = model.item(row)
+            for child_row in range(group.rowCount()):
+                child = group.child(child_row)
+                if child.data(Qt.UserRole) == index:
+                    self.ui.view.setCurrentIndex(child.index())
+                    self.review_item_selected(child.index())
+                    return
+
+    def review_item_selected(self, model_index):
+        item = self.ui.model.itemFromIndex(model_index)
+        if item.data(Qt.UserRole) is None:
+            item = item.child(0)
+        self.show_review_entry(item.data(Qt.UserRole))
+
+    def show_review_entry(self, index):
+        self.review_index = index
+        start, end, frame_duration, self.filename = self.get_review_entry(index)
+        self.prepare_file()
+
+        _video, self.player, self.seeker, _index = self.pool.show(index)
+        # the pooled player may already be loaded, take its state instead of waiting for observers
+        self.playback_len = self.player.duration
+        self.playback_pos = self.player.time_pos
+        self.frame_total = self.player.estimated_frame_count
+        self.frame_num = self.player.estimated_frame_number
+        self.segments = [(start * frame_duration, end * frame_duration)]
+        if self.playback_pos is not None:
+            self.on_player_loaded()
+        self.update_statusbar()
+        self.ui.seekbar.update()
 
-        
-        def save_can_print_out():
-            inputdata_file, outputdata_file = get_in_out_file("sync=")
-            
-            f_in = open(inputdata_file, 'r')
-            f_out = open(outputdata_file, 'w')
-            
-            f_out.write(f_in.readline())
-            for i in range(0, start-1):
-                f_in.readline()
-                
-            for i in range(start-1, end):
-                line = f_in.readline()   
-                line = line.replace(str(i), str(i- start + 1), 1)
-                line_split = line.split(",")
-                idx_time_parsing_line = line_split[0:2]
-                data_parsing_line = list(map(int, line_split[2:]))                
-
-                if i==start-1:
-                    self.min_canidx = min(x for x in data_parsing_line if x > 0) - 1
-                elif i==end-1:
-                    self.max_canidx = max(x for x in data_parsing_line if x > 0)                
-
-                for i in range(len(data_parsing_line)):
-                    if data_parsing_line[i] > 0 :
-                        data_parsing_line[i] -= self.min_canidx
-                
-                data_line = ", ".join(str(x) for x in data_parsing_line) + "\n"
-                idx_time_line = ", ".join(str(x) for x in idx_time_parsing_line) + ", "
-                
-                line = idx_time_line + data_line
-                f_out.write(line)
-        
-            f_in.close()
-            f_out.close()            
-            write_meta("sync="+os.path.split(outputdata_file)[1]+"\n")
+    def run_clicked(self):
+        if self.review_entries is not None:
+            self.execute_text_file(self.review_filename)
+        else:
+            self.run_ffmpeg()
 
-            
-        def save_dc_merged():
-            inputdata_file, outputdata_file = get_in_out_file("dgps_car=")  
-            
-            f_in = open(inputdata_file, 'r')
-            f_out = open(outputdata_file, 'w')
-            
-            for i in range(0, self.min_canidx):
-                f_in.readline()
-            for i in range(self.min_canidx, self.max_canidx+1):
-                line = f_in.readline()
-                line = line.replace(str(i), str(i-self.min_canidx), 1)
-                f_out.write(line)
-            
-            f_in.close()
-            f_out.close()
-            write_meta("dgps_car="+os.path.split(outputdata_file)[1]+"\n")
-        
-        def save_cam_params():
-            cam_params_filename = self.get_cmd_option(metainfo_file, "cam_params=")
-            inputdata_file = os.path.join(infile_path, cam_params_filename)
-            outputdata_file = os.path.join(outfile_path, cam_params_filename)      
-            shutil.copyfile(inputdata_file, outputdata_file)
-            write_meta("cam_params="+os.path.split(outputdata_file)[1]+"\n")
-             
-                    
-        def get_in_out_file(option):
-            filename = self.get_cmd_option(metainfo_file, option)
-            
-            inputdata_filename = os.path.join(infile_path, filename)
-            filename, ext = os.path.splitext(filename)
-            outputdata_filename = '%s.ffcutter.part%d-%d.txt' % (filename, start , end)
-            outputdata_filename = os.path.join(outfile_path, outputdata_filename)
-            
-            return inputdata_filename, outputdata_filename
-        
-        def write_meta(line):
-            outputdata_file = os.path.join(outfile_path, "metainfo.txt")
-            f_out = open(outputdata_file, 'a')
-            f_out.write(line)
-            f_out.close()
-        
-        
-        outputdata_file = os.path.join(outfile_path, "metainfo.txt")
-        open(outputdata_file, 'w').write("cam="+video_filename+"\n")
-        save_can_print_out()
-        save_dc_merged()
-        save_cam_params()
-        
-    
     # Load video file #############################################################################
     ###############################################################################################    
 
     def load_file(self):   
-        self.ui.horizontalLayout_3.removeWidget(self.ui.video)
-        self.ui.video = QtWidgets.QWidget()
-        self.ui.video.setFocusPolicy(QtCore.Qt.NoFocus)
-        self.ui.video.setStyleSheet("background-color: rgb(117, 80, 123);")
-        self.ui.video.setObjectName("video")
-        self.ui.horizontalLayout_3.addWidget(self.ui.video)
-        
+        # the video widget and the player are kept between files, mpv just switches to the new one
+        self.prepare_file()
+        if self.review_entries is not None:
+            self.review_entries = None
+            self.ui.view.hide()
+            self.ui.video.show()
+            for slot in self.pool.slots:
+                slot[0].hide()
+            self.player = None
+
+        if self.main_player is None:
+            self.main_player = self.init_player()
+
+            # SIGINT handling trickery    
+            timer = QtCore.QTimer(self)
+            timer.timerEvent = lambda _: None
+            timer.start(1000)
+        self.player, self.seeker = self.main_player
+        self.interrupted = False
+
+        self.ui.loading.show()
+        if self.preloaded == self.filename:
+            self.player.playlist_next('force')
+        else:
+            self.player.play(self.filename)
+        self.preloaded = None
+        if self.preload_next:
+            self.preload_file(self.get_next_file())
+        self.build_frame_index()
+
+    def build_frame_index(self):
+        # a full packet scan, done in the background, the index is used once it arrives
+        filename = self.filename
+        if not self.ffprobe_bin:
+            return
+
+        def build():
+            with tracer.span('frame_index'):
+                index = FrameIndex.from_ffprobe(self.ffprobe_bin, filename)
+            self.frameindex_built.emit(filename, index)
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def on_frame_index_built(self, filename, index):
+        if filename != self.filename:
+            return
+        self.frame_index = index
+        self.pts = index.pts
+        self.ipts = index.ipts
+        self.print('Frame index: %s' % index.memory_report())
+        self.ui.seekbar.update()
+
+    def prepare_file(self):
         self.segments = []
         self.save_file_path = None
         self.frame_total = None
@@ -398,8 +555,9 @@ class GUI(QtWidgets.QDialog):
         self.show_keyframes = False
         self.running_ffmpeg = False
 
-        self.pts = []
-        self.ipts = []
+        self.frame_index = FrameIndex()
+        self.pts = self.frame_index.pts
+        self.ipts = self.frame_index.ipts
         self.ffmpeg_shift_a = 0
         self.ffmpeg_shift_b = 0
         ##################################################
@@ -446,13 +604,33 @@ class GUI(QtWidgets.QDialog):
         self.shifts_dialog_ui.suggestion.hide()
         
         self.show()
-        self.init_player()
 
-        # SIGINT handling trickery    
-        timer = QtCore.QTimer(self)
-        timer.timerEvent = lambda _: None
-        timer.start(1000)
-        self.interrupted = False
+    def preload_file(self, filename):
+        # appended playlist entry is prefetched by mpv (prefetch-playlist), switching to it is almost instant
+        self.player.playlist_clear()
+        self.preloaded = filename
+        if filename is not None:
+            self.player.loadfile(filename, 'append')
+
+    def get_next_file(self):
+        dirname, basename = os.path.split(os.path.abspath(self.filename))
+        ext = os.path.splitext(basename)[1].lower()
+        names = sorted(f for f in os.listdir(dirname) if os.path.splitext(f)[1].lower() == ext)
+        try:
+            return os.path.join(dirname, names[names.index(basename) + 1])
+        except (ValueError, IndexError):
+            return None
+
+    def open_next_file(self):
+        filename = self.preloaded or self.get_next_file()
+        if filename is not None:
+            self.filename = filename
+            self.load_file()
+
+    def close_player(self):
+        if self.main_player is not None:
+            (player, _seeker), self.main_player = self.main_player, None
+            player.terminate()
         
         
     def interrupt(self):
@@ -465,14 +643,15 @@ class GUI(QtWidgets.QDialog):
     # Player #################################################################################
     ###############################################################################################
 
-    def init_player(self):
+    def init_player(self, video=None):
         def mpv_log(loglevel, component, message):
             self.print('Mpv log: [{}] {}: {}'.format(loglevel, component, message))
         
         mpv_args = []
         mpv_kw = {
-            'wid': int(self.ui.video.winId()),
-            'keep-open': 'yes',
+            'wid': int((video or self.ui.video).winId()),
+            'keep-open': 'always',
+            'prefetch-playlist': 'yes',
             'rebase-start-time': 'no',
             'framedrop': 'no',
             'osd-level': '2',
@@ -487,38 +666,56 @@ class GUI(QtWidgets.QDialog):
 
         
         player = MPV(*mpv_args, log_handler=mpv_log, **mpv_kw)
-        self.player = player
         player.pause = True
-
-        def on_player_loaded():
-            if self.ffmpeg_bin:
-                self.check_ffmpeg_seek_problem()
-            self.ui.loading.hide()
-            self.state_loaded = True
+        player.cache_property('chapter-list')
+        seeker = SeekController(player)
+
+        # several players may exist while reviewing a cut list, only the shown one updates the GUI state
+        def on_event(devent):
+            # per-file state is reset whenever mpv switches to another file
+            if devent['event_id'] == MpvEventID.START_FILE and player is self.player:
+                self.playback_pos = None
+                self.playback_len = None
+                self.frame_num = None
+                self.frame_total = None
 
         def on_playback_len(s):
-            self.playback_len = s
-            player.unobserve_property('duration', on_playback_len)
+            if player is self.player:
+                self.playback_len = s
 
         def on_playback_pos(s):
-            player.observe_property('estimated-frame-number', on_framenum_count)
+            if s is None or player is not self.player:
+                return
             if self.playback_pos is None:
                 self.player_loaded.emit()
             self.playback_pos = s
+            self.seeker.on_position()
             self.statusbar_update.emit()
             self.ui.seekbar.update()
             
         def on_framenum_count(s):
-            self.frame_num = s
+            if player is self.player:
+                self.frame_num = s
             
         def on_frametotal_total(s):
-            self.frame_total = s
+            if player is self.player:
+                self.frame_total = s
             
-        self.player_loaded.connect(on_player_loaded)
+        player.register_event_callback(on_event)
         player.observe_property('estimated-frame-count', on_frametotal_total)         
+        player.observe_property('estimated-frame-number', on_framenum_count)
         player.observe_property('time-pos', on_playback_pos)
         player.observe_property('duration', on_playback_len)
-        player.play(self.filename)
+        if video is None:
+            QtWidgets.QApplication.instance().aboutToQuit.connect(self.close_player)
+        return player, seeker
+
+    def on_player_loaded(self):
+        # the stream copy check is too slow to run for every entry of a reviewed cut list
+        if self.ffmpeg_bin and self.review_entries is None:
+            self.check_ffmpeg_seek_problem()
+        self.ui.loading.hide()
+        self.state_loaded = True
         
     def check_ffmpeg_seek_problem(self):
         self.print('Testing if ffmpeg stream copy seeking on this file works correctly...')
@@ -533,7 +730,7 @@ class GUI(QtWidgets.QDialog):
         def find_global_frame_shift():
             cmd = [self.ffprobe_bin, self.filename] + '-show_frames -show_packets -select_streams v -print_format json=c=1 -v error'.split()
             proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-            pts = []
+            pts = array('d')
             while True:
                 line = proc.stdout.readline().decode()
                 if not line:
@@ -550,16 +747,7 @@ class GUI(QtWidgets.QDialog):
     
             proc.terminate()
     
-            q = collections.deque(maxlen=10)
-            for t in sorted(set(pts)):
-                rm = []
-                for v in q:
-                    if abs(v-t) <= 0.002:
-                        rm.append(v)
-                for v in rm:
-                    q.remove(v)
-                    pts.remove(v)
-    
+            pts = dedupe_close(pts, 0.002)
             if len(pts) > 1:
                 label = self.shifts_dialog_ui.suggestion
                 label.show()
@@ -694,7 +882,7 @@ class GUI(QtWidgets.QDialog):
         i = sidesi(self.playback_pos, anchors)[0 if backwards else 1]
 
         if i is not None:
-            self.player.seek(anchors[i], 'absolute', 'exact')
+            self.seeker.seek(anchors[i], 'absolute', 'exact')
 
     def keyPressEvent(self, event):
         k = event.key()
@@ -727,6 +915,14 @@ class GUI(QtWidgets.QDialog):
 
             self.print(doc)
 
+        elif k == Qt.Key_N and self.player is not None and self.review_entries is None:
+
+            self.open_next_file()
+
+        elif k in (Qt.Key_PageUp, Qt.Key_PageDown) and self.review_entries is not None:
+
+            self.select_review_entry(self.review_index + (1 if k == Qt.Key_PageDown else -1))
+
         ################################
 
         if self.playback_pos is None or not self.state_loaded:
@@ -735,33 +931,38 @@ class GUI(QtWidgets.QDialog):
         ################################
 
         if k == Qt.Key_Space:
-            self.player.pause = not self.player.pause
+            self.player.command_async('cycle', 'pause')
 
         elif k == Qt.Key_Up:
-            self.player.seek(5, 'relative-percent')
+            self.seeker.seek(5, 'relative-percent')
 
         elif k == Qt.Key_Down:
-            self.player.seek(-5, 'relative-percent')
+            self.seeker.seek(-5, 'relative-percent')
 
         elif k == Qt.Key_Left:
             if ctrl:
-                self.player.seek(-1, 'relative', 'exact')
+                self.seeker.seek(-1, 'relative', 'exact')
             elif alt:
                 self.to_next_anchor(True)
             else:
-                self.player.frame_back_step()
+                self.seeker.frame_back_step()
 
         elif k == Qt.Key_Right:
             if ctrl:
-                self.player.seek(1, 'relative', 'exact')
+                self.seeker.seek(1, 'relative', 'exact')
             elif alt:
                 self.to_next_anchor()
             else:
-                self.player.frame_step()
+                self.seeker.frame_step()
 
         elif k == Qt.Key_Z:
             self.put_anchor()
 
+        elif k == Qt.Key_K:
+
+            self.show_keyframes = not self.show_keyframes
+            self.ui.seekbar.update()
+
         elif k == Qt.Key_X:
             self.del_anchor()
 
@@ -941,6 +1142,17 @@ class GUI(QtWidgets.QDialog):
 
         return outfile, outargs, inargs
 
+    def get_user_option(self, name, choices):
+        """ Value of a `name: value` line of the arguments editor, the first choice if it's missing or invalid. """
+        for line in self.ui.argsEdit.toPlainText().splitlines():
+            line = line.strip()
+            if line.startswith(name + ':'):
+                value = line[len(name)+1:].strip()
+                if value in choices:
+                    return value
+                self.print_error('Unknown %s "%s", expected one of: %s' % (name, value, ', '.join(choices)))
+        return choices[0]
+
 
     # Run ffnoeg ##################################################################################
     ###############################################################################################
@@ -976,10 +1188,46 @@ class GUI(QtWidgets.QDialog):
 
         # generate the commands       
         ffmpeg = self.ffmpeg_bin or 'ffmpeg'
+        self.split = None
+        self.encoder = None
+        self.virtual_cuts = None
+        virtual = self.get_user_option('virtual', ('no',) + VIRTUAL_FORMATS)
+        if virtual != 'no':
+            self.virtual_cuts = self.plan_virtual_cuts(virtual, segments, tmpfiles)
+            return []
+
+        try:
+            selection = self.get_stream_selection()
+        except ValueError as e:
+            self.print_error(str(e))
+            return []
+        if self.ui.encode.isChecked() and not (self.jobs > 1 or self.ui.twoPass.isChecked()):
+            command = self.make_encode_command(ffmpeg, segments, tmpfiles, outfile, inargs, outargs, selection)
+            return [command] if command else []
+        if selection is not None:
+            outargs = [arg for index in selection for arg in ('-map', '0:%d' % index)] + outargs
+        if self.ui.encode.isChecked():
+            self.encoder = self.make_parallel_encoder(ffmpeg, segments, tmpfiles, outfile, inargs, outargs)
+            return self.encoder.commands
+
         encode_command = [ffmpeg] + inargs + ['-i', self.filename, '-y']
         for i, seg in enumerate(segments):
             a, b = seg
             encode_command += ['-ss', str(a), '-to', str(b), '-c', 'copy'] + outargs + [tmpfiles[i]]
+
+        # dense plans read the input once through the segment muxer
+        split = SegmentSplit(segments, tmpfiles, self.playback_len)
+        mode = self.get_user_option('split', SPLIT_MODES)
+        if segments and prefer_split(mode, encode_command):
+            if split.possible:
+                if mode == 'auto':
+                    self.print('%d segments are too many for one command line, cutting them with the segment '
+                               'muxer: every piece starts on a keyframe.' % len(segments))
+                self.split = split
+                self.split_outfile = os.path.join(self.save_file_path, outfile)
+                encode_command = split.make_command(ffmpeg, self.filename, self.split_outfile, inargs, outargs)
+            else:
+                self.print_error('Overlapping segments, not using the segment muxer.')
         encode_commands.append(encode_command)
 
         for cmd in encode_commands:
@@ -989,15 +1237,86 @@ class GUI(QtWidgets.QDialog):
                 cmd.pop(i-1)
         return encode_commands
     
+    def get_stream_selection(self):
+        """ Stream indexes chosen by the streams: argument line or --streams, None to leave it to ffmpeg. """
+        spec = self.cutter.streams
+        for line in self.ui.argsEdit.toPlainText().splitlines():
+            line = line.strip()
+            if line.startswith('streams:'):
+                spec = line[8:].strip() or spec
+        if not spec:
+            return None
+        streams = probe_streams(self.ffprobe_bin, self.filename)
+        if streams is None:
+            raise ValueError('Selecting streams needs ffprobe')
+        return select_streams(streams, spec)
+
+    def make_encode_command(self, ffmpeg, segments, tmpfiles, outfile, inargs, outargs, selection=None):
+        streams = probe_streams(self.ffprobe_bin, self.filename)
+        if streams is None:
+            self.print_error('No ffprobe to look for audio, encoding video only.')
+        # the filter graph trims one video and one audio stream, a selection can leave out either
+        video, audio = '0:v', '0:a' if has_stream(streams, 'audio') else None
+        if selection is not None:
+            types = {s['index']: s.get('codec_type') for s in streams}
+            video = next(('0:%d' % i for i in selection if types[i] == 'video'), None)
+            audio = next(('0:%d' % i for i in selection if types[i] == 'audio'), None)
+            if video is None and audio is None:
+                self.print_error('The selected streams have no video or audio stream to encode.')
+                return None
+        join = self.get_user_option('join', ('no', 'yes')) == 'yes'
+        outfiles = [os.path.join(self.save_file_path, outfile)] if join else tmpfiles
+        return make_encode_command(ffmpeg, self.filename, segments, outfiles, inargs, outargs, video, audio, join)
+
+    def plan_virtual_cuts(self, fmt, segments, tmpfiles):
+        """ [(format, playlist, start, end)] of a plan that writes playlists into the input instead of media. """
+        fmt = virtual_format(fmt, self.filename)
+        if fmt == 'm3u8' and not self.ffprobe_bin:
+            self.print_error('No ffprobe to index keyframes, writing ffconcat playlists.')
+            fmt = 'ffconcat'
+        return [(fmt, os.path.splitext(tmpfile)[0] + '.' + fmt, a, b) for (a, b), tmpfile in zip(segments, tmpfiles)]
+
+    def write_virtual_cuts(self):
+        """ Returns 0 on success, 1 if a playlist couldn't be written. """
+        try:
+            keyframes = None
+            if any(fmt == 'm3u8' for fmt, _, _, _ in self.virtual_cuts):
+                keyframes = probe_keyframes(self.ffprobe_bin, self.filename)
+            for fmt, playlist, a, b in self.virtual_cuts:
+                write_virtual_cut(fmt, playlist, self.filename, a, b, keyframes)
+                self.print(playlist)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.print_error('Writing playlists failed: %s' % e)
+            return 1
+        return 0
+
+    def make_parallel_encoder(self, ffmpeg, segments, tmpfiles, outfile, inargs, outargs):
+        join = self.get_user_option('join', ('no', 'yes')) == 'yes'
+        outfiles = [os.path.join(self.save_file_path, outfile)] if join else tmpfiles
+        stats_dir = os.path.join(self.tmpdir, 'passlogs') if self.ui.twoPass.isChecked() else None
+        return ParallelEncoder(ffmpeg, self.filename, segments, outfiles, self.ipts, self.jobs, inargs, outargs,
+                               join, self.print, self.print_error, stats_dir)
+
     def print_ffmpeg(self):
         self.print()
         for args in self.make_ffmpeg():
             self.print(' '.join(args))
+        for fmt, playlist, a, b in self.virtual_cuts or ():
+            self.print('%s %s %.6f-%.6f' % (fmt, playlist, a, b))
         self.print()
 
     def run_ffmpeg(self, commands = None):
         if not commands :
             commands = self.make_ffmpeg()
+            if self.virtual_cuts is not None:
+                # indexing the keyframes reads the whole input
+                self.run_threaded(None, self.write_virtual_cuts)
+                return
+            if self.encoder is not None:
+                self.run_threaded(self.encoder, self.encoder.run)
+                return
+            if not commands:
+                return
         commands_len = len(commands)
         self._proc = None
         
@@ -1006,29 +1325,27 @@ class GUI(QtWidgets.QDialog):
             self.print()
             self.print('%d/%d - %s' % (commands_len - len(commands), commands_len, ' '.join(args)))
             self._proc = subprocess.Popen(args)
-
-        def stop(exit_code):
-            self.ui.run.setEnabled(True)
-            self.running_ffmpeg = False
-            timer.stop()
-            self.print()
-            if self.interrupted:
-                self.print_error('Interrupted. Command exit code: %s' % exit_code)
-                self.interrupted = False
-            elif exit_code == 0:
-                self.print('Done.')
-                self.ui.success = QtWidgets.QMessageBox()
-                self.ui.success.setWindowTitle('Success')
-                self.ui.success.setText('Successfully Save Files')
-                self.ui.success.exec()
-            else:
-                self.print_error('Fail. Command exit code: %s' % exit_code)
+            self._proc_args = args
+            self._proc_started = time.perf_counter()
+            self._proc_span = tracer.begin(os.path.basename(args[0]), args=' '.join(args))
 
         def check(_):
-            code = self._proc.poll()
+            code, rusage, io = metrics.reap(self._proc)
             if code is not None:
+                tracer.end(self._proc_span, tid=self._proc.pid, exit_code=code)
+                if metrics.recorder.enabled:
+                    metrics.recorder.write('ffmpeg', **metrics.process_record(
+                        self._proc_args, self._proc_started, code, rusage, io))
+                if self.profiling is not None:
+                    self.profiling.flush()
+                if self.split is not None and (code != 0 or not commands):
+                    if code == 0:
+                        self.split.finish(self.split_outfile)
+                    else:
+                        self.split.discard(self.split_outfile)
+                    self.split = None
                 if code != 0 or not commands:
-                    stop(code)
+                    self.finish_run(code, timer)
                 else:
                     next_run()
             elif self.interrupted:
@@ -1042,6 +1359,61 @@ class GUI(QtWidgets.QDialog):
         timer.setInterval(1000)
         timer.start()
         self.ui.run.setEnabled(False)
+
+    def run_jobs(self, segments):
+        runner = JobRunner(self.cutter, self.jobs, self.print, self.print_error)
+
+        def work():
+            code = runner.run(segments)
+            if isinstance(segments, CutList):
+                if segments.lines == segments.skipped:
+                    self.print_error("Input file doesn't have a proper form")
+                    return code or 1
+                if segments.skipped:
+                    self.print_error('%d of %d cut list lines skipped.' % (segments.skipped, segments.lines))
+            return code
+
+        self.run_threaded(runner, work)
+
+    def run_threaded(self, runner, work):
+        # the runner's processes are started from worker threads, the timer only watches them (runner None: work
+        # that can't be interrupted)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(work()), daemon=True)
+
+        def check(_):
+            if runner is not None and self.interrupted and not runner.interrupted:
+                runner.interrupt()
+            if not thread.is_alive():
+                if self.profiling is not None:
+                    self.profiling.flush()
+                self.finish_run(result[0] if result else 1, timer)
+
+        self.running_ffmpeg = True
+        thread.start()
+
+        timer = QtCore.QTimer(self)
+        timer.timerEvent = check
+        timer.setInterval(200)
+        timer.start()
+        self.ui.run.setEnabled(False)
+
+    def finish_run(self, exit_code, timer):
+        self.ui.run.setEnabled(True)
+        self.running_ffmpeg = False
+        timer.stop()
+        self.print()
+        if self.interrupted:
+            self.print_error('Interrupted. Command exit code: %s' % exit_code)
+            self.interrupted = False
+        elif exit_code == 0:
+            self.print('Done.')
+            self.ui.success = QtWidgets.QMessageBox()
+            self.ui.success.setWindowTitle('Success')
+            self.ui.success.setText('Successfully Save Files')
+            self.ui.success.exec()
+        else:
+            self.print_error('Fail. Command exit code: %s' % exit_code)
         
         
     # Bar #########################################################################################
@@ -1062,13 +1434,19 @@ class GUI(QtWidgets.QDialog):
             return
 
         self.seekbar_pressed = True
-        precision = 'exact' if event.modifiers() == Qt.ControlModifier else None
-        self.player.seek(event.x() / (self.ui.seekbar.width() / 100), 'absolute-percent', precision)
+        # keyframe seeks keep up with the cursor while dragging, the exact position is seeked on release
+        precision = 'exact' if event.modifiers() == Qt.ControlModifier else 'keyframes'
+        self.seeker.seek(self.seekbar_percent(event), 'absolute-percent', precision)
         self.ui.seekbar.update()
 
     def seekbar_mouse_release_event(self, event):
+        if self.seekbar_pressed and self.playback_pos is not None:
+            self.seeker.seek(self.seekbar_percent(event), 'absolute-percent', 'exact')
         self.seekbar_pressed = False
 
+    def seekbar_percent(self, event):
+        return min(max(event.x() / (self.ui.seekbar.width() / 100), 0), 100)
+
     def seekbar_paint_event(self, event):
         if self.playback_pos is None:
             return
@@ -1147,9 +1525,10 @@ class GUI(QtWidgets.QDialog):
             painter.drawLine(self.hover_cursor, 0, self.hover_cursor, seekbar.height())
 
         # chapters
-        if self.player.chapter_list:
+        chapters = self.player.chapter_list
+        if chapters:
             painter.setPen(Qt.black)
-            for ch in self.player.chapter_list:
+            for ch in chapters:
                 x = time_to_x(ch['time'])
                 painter.drawPoint(x, 0)
                 painter.drawPoint(x-1, 0)
@@ -1266,15 +1645,6 @@ def sides(target, elements, **kw):
     return (a, b)
 
 
-def closest(target, elements, max_diff=None):
-    try:
-        el = min(elements, key=lambda e: abs(target-e))
-        if max_diff is None or abs(el - target) < max_diff:
-            return el
-    except ValueError:
-        pass
-
-
 def floor(number, ndigits=0):
     if not ndigits:
         return math.floor(number)
@@ -1319,6 +1689,7 @@ def parse_time(string):
     else:
         return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
 
+
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
 
@@ -1332,7 +1703,31 @@ if __name__ == '__main__':
     if no_index:
         sys.argv.remove('--no-index')
     args = docopt(doc)
-    gui = GUI(args['<video-file>'], args['-s'], args['--mpv'], no_index)
+    gui = GUI(args['<video-file>'], args['-s'], args['--mpv'], no_index, args['--preload-next'], args['--review'])
+    if args['--trace'] or args['--profile']:
+        gui.profiling = Session(args['--trace'], args['--profile'])
+        app.aboutToQuit.connect(gui.profiling.finish)
+    gui.jobs = int(args['--jobs'])
+    gui.cutter.link_unchanged = args['--hardlink']
+    gui.cutter.column_cache = args['--column-cache']
+    if args['--data-format'] not in DATA_FORMATS:
+        sys.exit('Unknown data format: %s' % args['--data-format'])
+    if args['--data-format'] in ('npy', 'npz') and datafiles.numpy is None:
+        sys.exit('The %s data format needs numpy.' % args['--data-format'])
+    gui.cutter.data_format = args['--data-format']
+    if args['--compress'] and '.' + args['--compress'] not in datafiles.COMPRESSORS:
+        sys.exit('Unknown compression: %s' % args['--compress'])
+    if args['--compress'] and args['--data-format'] in ('npy', 'bin'):
+        sys.exit('The %s data format can\'t be compressed, use npz or text.' % args['--data-format'])
+    gui.cutter.compress = args['--compress']
+    gui.cutter.streams = args['--streams']
+    for stream in args['--stream']:
+        key, _, kind = stream.partition(':')
+        if not hasattr(Cutter, 'cut_' + kind):
+            sys.exit('Unknown data stream kind: %s' % stream)
+        gui.cutter.stream_kinds = dict(gui.cutter.stream_kinds, **{key: kind})
+    if args['--metrics']:
+        metrics.recorder.open(args['--metrics'])
 
     # for qt + ctrl-c
     signal.signal(signal.SIGINT, lambda *_: gui.interrupt())
@@ -0,0 +1,76 @@
+import bisect
+import subprocess
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FrameIndex(object):
+    """ Timestamps of all video packets (pts) and of the keyframes (ipts), sorted and de-duplicated.
+
+    They are kept in contiguous double buffers (numpy arrays if numpy is installed, array('d') otherwise), 8 bytes
+    per frame instead of the ~40 of a list of boxed floats. """
+
+    def __init__(self, pts=(), ipts=()):
+        self.pts = unique_sorted(pts)
+        self.ipts = unique_sorted(ipts)
+
+    @classmethod
+    def from_ffprobe(cls, ffprobe_bin, filename):
+        cmd = [ffprobe_bin, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+               '-of', 'csv=p=0', filename]
+        pts = array('d')
+        ipts = array('d')
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        for line in proc.stdout:
+            t, _, flags = line.partition(b',')
+            try:
+                t = float(t)
+            except ValueError: # N/A
+                continue
+            pts.append(t)
+            if flags.startswith(b'K'):
+                ipts.append(t)
+        proc.wait()
+        return cls(pts, ipts)
+
+    @property
+    def nbytes(self):
+        return buffer_size(self.pts) + buffer_size(self.ipts)
+
+    def memory_report(self):
+        frames = len(self.pts)
+        return '%d frames, %d keyframes, %.1f MB (%.1f bytes per frame)' % (
+            frames, len(self.ipts), self.nbytes / 2**20, buffer_size(self.pts) / frames if frames else 0)
+
+
+def buffer_size(values):
+    return values.nbytes if numpy is not None else values.itemsize * len(values)
+
+
+def unique_sorted(values):
+    if numpy is not None:
+        return numpy.unique(numpy.asarray(values, dtype=numpy.float64))
+    return array('d', sorted(set(values)))
+
+
+def dedupe_close(values, tolerance):
+    """ unique_sorted() that also merges timestamps closer than tolerance to their predecessor. """
+    values = unique_sorted(values)
+    if len(values) < 2:
+        return values
+    if numpy is not None:
+        return values[numpy.concatenate(([True], numpy.diff(values) > tolerance))]
+    return array('d', (t for i, t in enumerate(values) if i == 0 or t - values[i-1] > tolerance))
+
+
+def closest(target, sorted_elements, max_diff=None):
+    i = bisect.bisect_left(sorted_elements, target)
+    candidates = sorted_elements[max(i-1, 0):i+1]
+    if len(candidates):
+        el = float(min(candidates, key=lambda e: abs(target-e)))
+        if max_diff is None or abs(el - target) < max_diff:
+            return el
@@ -37,32 +37,20 @@ class Ui_main(object):
         self.horizontalLayout_3.addWidget(self.video)
         
         
-#################################################
-#        data = [
-#            {"type": "Fruit", "objects": ["Apple", "Banana"]},
-#            {"type": "Vegetable", "objects": ["Carrot", "Tomato"]s},
-#        ]
-#        self.model = QtGui.QStandardItemModel()
-#        self.model.setHorizontalHeaderLabels(['video name'])
-#        
-#        d = data[0]
-#        item = QtGui.QStandardItem(d["type"])
-#        child = QtGui.QStandardItem(d["objects"][0])  # Apple
-#        item.appendRow(child)
-#        child = QtGui.QStandardItem(d["objects"][1])  # Banana
-#        item.appendRow(child)
-#        self.model.setItem(0, 0, item)
-#        
-#        self.view = QtWidgets.QTreeView()
-#        self.view.setFocusPolicy(QtCore.Qt.NoFocus)
-#        self.view.setObjectName("video_names")
-#        self.view.setEditTriggers(QtWidgets.QAbstractItemView.DoubleClicked)
-#        self.view.setModel(self.model)
-#
-#        self.view.setAnimated(True)
-#        self.view.setFixedWidth(300)
-#        self.horizontalLayout_3.addWidget(self.view)
-##########################################################
+        # cut list review, hidden unless a cut list is opened in review mode
+        self.model = QtGui.QStandardItemModel()
+        self.model.setHorizontalHeaderLabels(['video name'])
+        
+        self.view = QtWidgets.QTreeView()
+        self.view.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.view.setObjectName("video_names")
+        self.view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.view.setModel(self.model)
+
+        self.view.setAnimated(True)
+        self.view.setFixedWidth(300)
+        self.view.hide()
+        self.horizontalLayout_3.addWidget(self.view)
         
         self.verticalLayout.addLayout(self.horizontalLayout_3)
         
@@ -108,6 +96,18 @@ class Ui_main(object):
         spacerItem = QtWidgets.QSpacerItem(383, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout_2.addItem(spacerItem)
         
+        self.encode = QtWidgets.QCheckBox(self.widget)
+        self.encode.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.encode.setObjectName("encode")
+        self.horizontalLayout_2.addWidget(self.encode)
+        
+        self.twoPass = QtWidgets.QCheckBox(self.widget)
+        self.twoPass.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.twoPass.setCheckable(True)
+        self.twoPass.setChecked(False)
+        self.twoPass.setObjectName("twoPass")
+        self.horizontalLayout_2.addWidget(self.twoPass)
+        
         self.toggleArgsEdit = QtWidgets.QToolButton(self.widget)
         self.toggleArgsEdit.setMinimumSize(QtCore.QSize(0, 23))
         self.toggleArgsEdit.setFocusPolicy(QtCore.Qt.NoFocus)
@@ -179,6 +179,8 @@ class Ui_main(object):
         main.setWindowTitle(_translate("main", "ffcutter"))
         self.keep.setText(_translate("main", "Keep"))
         self.remove.setText(_translate("main", "Remove"))
+        self.encode.setText(_translate("main", "Encode"))
+        self.twoPass.setText(_translate("main", "2-pass"))
         self.toggleArgsEdit.setToolTip(_translate("main", "Show/hide ffmpeg arguments editor"))
         self.toggleArgsEdit.setText(_translate("main", "Edit Args"))
         self.toggleArgsEdit.setShortcut(_translate("main", "E"))
@@ -0,0 +1,154 @@
+import os
+import time
+import signal
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+from profiling import tracer
+
+
+class Job(object):
+    """ One line of a cut list. The data files and the video are cut into a private staging directory inside the
+    output directory and moved into place with renames once all of them succeeded, so jobs that share an output
+    directory never see each other's partial files. The job's own metainfo.txt is kept as
+    metainfo.part<start>-<end>.txt. """
+
+    def __init__(self, segment, index):
+        self.segment = segment
+        self.index = index
+        self.command = None
+        self.metainfo = None # name of the committed metainfo file
+
+    @property
+    def output_dir(self):
+        return self.segment[1]
+
+    def run(self, cutter, runner):
+        os.makedirs(self.output_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.ffcutter-staging-', dir=self.output_dir)
+        try:
+            self.command = cutter.make_ffmpeg_command(self.segment, staging)
+            code = runner.run_process(self.command)
+            if code == 0:
+                self.commit(staging)
+            return code
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def commit(self, staging):
+        start, end = self.segment[2], self.segment[3]
+        for name in sorted(os.listdir(staging)):
+            target = name
+            if name == 'metainfo.txt':
+                target = self.metainfo = 'metainfo.part%d-%d.txt' % (start, end)
+            os.replace(os.path.join(staging, name), os.path.join(self.output_dir, target))
+
+
+class ProcessPool(object):
+    """ Base of the runners that start ffmpeg processes from worker threads: logs and records every process and
+    interrupts all running ones at once. """
+
+    def __init__(self, jobs=1, log=print, log_error=print):
+        self.jobs = jobs
+        self.log = log
+        self.log_error = log_error
+        self.lock = threading.Lock()
+        self.running = set()
+        self.started = 0
+        self.total = 0
+        self.failed = False
+        self.interrupted = False
+
+    def run_process(self, args):
+        """ Returns the exit code, None if interrupted before the start. """
+        with self.lock:
+            if self.interrupted:
+                return None
+            self.started += 1
+            self.log('\n%d/%s - %s' % (self.started, self.total or '?', ' '.join(args)))
+            proc = subprocess.Popen(args)
+            self.running.add(proc)
+        started = time.perf_counter()
+        span = tracer.begin(os.path.basename(args[0]), args=' '.join(args))
+
+        code, rusage, io = metrics.wait(proc)
+        with self.lock:
+            self.running.discard(proc)
+        tracer.end(span, tid=proc.pid, exit_code=code)
+        if metrics.recorder.enabled:
+            metrics.recorder.write('ffmpeg', **metrics.process_record(args, started, code, rusage, io))
+        return code
+
+    def interrupt(self):
+        with self.lock:
+            self.interrupted = True
+            for proc in self.running:
+                proc.send_signal(signal.SIGINT)
+
+
+class JobRunner(ProcessPool):
+    """ Runs the lines of a cut list on `jobs` worker threads, one ffmpeg process each. The result doesn't depend
+    on the number of workers: every job commits its own files, and the metainfo.txt of an output directory is the
+    one of its last job in list order, as if they had run one after another. Like a sequential run, nothing new is
+    started after a failure or an interrupt. """
+
+    def __init__(self, cutter, jobs=1, log=print, log_error=print):
+        super().__init__(jobs, log, log_error)
+        self.cutter = cutter
+
+    def run(self, segments, pool=None):
+        """ Returns the exit code of the first failed job in list order, 0 if all of them succeeded.
+
+        segments may be a lazy iterable like cutlist.CutList: lines are read as workers become free, so a long
+        list starts right away and only a few jobs are held at a time. The jobs run on `pool` if given (a
+        long running executor shared by several lists), else on a pool of `jobs` threads of their own. """
+        if hasattr(segments, '__len__'):
+            self.total = len(segments)
+        self.first_failure = None # (index, exit code)
+        self.last_jobs = {} # output directory -> its last job in list order that succeeded
+        pending = set()
+        own_pool = pool is None
+        if own_pool:
+            pool = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            for i, segment in enumerate(segments):
+                if self.failed or self.interrupted:
+                    break
+                while len(pending) >= self.jobs * 2:
+                    _done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(pool.submit(self.run_job, Job(segment, i)))
+            wait(pending)
+        finally:
+            if own_pool:
+                pool.shutdown()
+        self.merge_metainfo()
+        return self.first_failure[1] if self.first_failure else 0
+
+    def run_job(self, job):
+        if self.failed or self.interrupted:
+            return None
+        try:
+            code = job.run(self.cutter, self)
+        except Exception as e:
+            self.log_error('Job %d (%s) failed: %s' % (job.index + 1, job.segment[0], e))
+            code = 1
+        with self.lock:
+            if code not in (0, None) and (self.first_failure is None or job.index < self.first_failure[0]):
+                self.first_failure = (job.index, code)
+            if code == 0 and job.metainfo:
+                last = self.last_jobs.get(os.path.abspath(job.output_dir))
+                if last is None or last.index < job.index:
+                    self.last_jobs[os.path.abspath(job.output_dir)] = job
+        if code != 0:
+            self.failed = True
+        return code
+
+    def merge_metainfo(self):
+        for output_dir, job in self.last_jobs.items():
+            tmp = os.path.join(output_dir, '.metainfo.txt.%d.tmp' % os.getpid())
+            shutil.copyfile(os.path.join(output_dir, job.metainfo), tmp)
+            os.replace(tmp, os.path.join(output_dir, 'metainfo.txt'))
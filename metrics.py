@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import json
+import threading
+import collections
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Recorder(object):
+    """ Appends one JSON record per job (ffmpeg process, save_data_file call) to a JSONL file. Does nothing
+    until open() is called. """
+
+    def __init__(self):
+        self.filename = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.filename is not None
+
+    def open(self, filename):
+        self.filename = filename
+
+    def write(self, stage, **record):
+        if self.filename is None:
+            return
+        record = dict(stage=stage, time=time.time(), **record)
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            with open(self.filename, 'a') as fp:
+                fp.write(line)
+
+
+recorder = Recorder()
+
+
+class Usage(object):
+    """ Wall time, CPU time of the calling thread and peak RSS of the process around a block of python code. """
+
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def stop(self):
+        return {
+            'wall': time.perf_counter() - self.wall,
+            'cpu': time.thread_time() - self.cpu,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        }
+
+
+def proc_io(pid):
+    """ Bytes read/written by a process (Linux /proc/<pid>/io), None where unavailable. """
+    try:
+        with open('/proc/%d/io' % pid) as fp:
+            return {k: int(v) for k, v in (line.split(': ') for line in fp)}
+    except (OSError, ValueError):
+        return None
+
+
+def reap(proc):
+    """ Non-blocking replacement of Popen.poll() that also collects the child's resource usage.
+
+    Returns (exit code or None while running, rusage or None, io counters or None). """
+    if not hasattr(os, 'wait4'):
+        return proc.poll(), None, None
+    if proc.returncode is not None:
+        return proc.returncode, None, None
+
+    io = None
+    try:
+        # peek without reaping, the io counters disappear with the zombie
+        if os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+            return None, None, None
+        io = proc_io(proc.pid)
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+    except ChildProcessError:
+        return proc.poll(), None, None
+    if pid == 0:
+        return None, None, None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, rusage, io
+
+
+def wait(proc):
+    """ Blocking reap(). """
+    if not hasattr(os, 'wait4'):
+        return proc.wait(), None, None
+    try:
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        io = proc_io(proc.pid)
+        _pid, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        return proc.wait(), None, None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, rusage, io
+
+
+def process_record(args, started, exit_code, rusage, io):
+    """ Metrics of a finished ffmpeg/ffprobe process started at time.perf_counter() value `started`. """
+    input_file = args[args.index('-i') + 1] if '-i' in args else None
+    output_file = args[-1]
+    record = {
+        'command': args,
+        'input': input_file,
+        'output': output_file,
+        'wall': time.perf_counter() - started,
+        'exit_code': exit_code,
+        'cpu': None,
+        'peak_rss_kb': None,
+    }
+    if rusage is not None:
+        record['cpu'] = rusage.ru_utime + rusage.ru_stime
+        record['peak_rss_kb'] = rusage.ru_maxrss
+    if io is not None:
+        record['input_bytes'] = io['rchar']
+        record['output_bytes'] = io['wchar']
+    else:
+        record['input_bytes'] = file_size(input_file)
+        record['output_bytes'] = file_size(output_file)
+    return record
+
+
+def file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except (OSError, TypeError):
+        return None
+
+
+# Summary report ##############################################################################
+###############################################################################################
+
+def summarize(filename):
+    """ Aggregates a metrics file per input file and per stage (save_data_file steps count as stages too). """
+    per_input = collections.OrderedDict()
+    per_stage = collections.OrderedDict()
+
+    def add(table, key, record):
+        row = table.setdefault(key, collections.Counter())
+        row['jobs'] += 1
+        row['failed'] += 1 if record.get('exit_code') else 0
+        for field in ('input_bytes', 'output_bytes', 'rows_read', 'rows_written', 'wall', 'cpu'):
+            row[field] += record.get(field) or 0
+        row['peak_rss_kb'] = max(row['peak_rss_kb'], record.get('peak_rss_kb') or 0)
+
+    with open(filename) as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            add(per_input, record.get('input'), record)
+            add(per_stage, record['stage'], record)
+            for name, step in record.get('steps', {}).items():
+                add(per_stage, '%s/%s' % (record['stage'], name), step)
+
+    return per_input, per_stage
+
+
+def print_report(filename, out=sys.stdout):
+    per_input, per_stage = summarize(filename)
+    header = '%-48s %6s %6s %12s %12s %10s %10s %10s %10s' % (
+        '', 'jobs', 'failed', 'in MB', 'out MB', 'rows', 'wall s', 'cpu s', 'MB/s')
+
+    for title, table in (('Per input file', per_input), ('Per stage', per_stage)):
+        print(title, file=out)
+        print(header, file=out)
+        for key, row in table.items():
+            mb_in = row['input_bytes'] / 2**20
+            print('%-48s %6d %6d %12.2f %12.2f %10d %10.2f %10.2f %10.2f' % (
+                str(key)[-48:], row['jobs'], row['failed'], mb_in, row['output_bytes'] / 2**20,
+                row['rows_written'], row['wall'], row['cpu'], mb_in / row['wall'] if row['wall'] else 0), file=out)
+        print(file=out)
@@ -9,6 +9,7 @@ from functools import partial
 import collections
 import re
 import traceback
+from concurrent.futures import Future
 
 # vim: ts=4 sw=4 et
 
@@ -207,6 +208,14 @@ class MpvEventProperty(Structure):
                     'format': self.format,
                     'data': self.data,
                     'value': proptype(cast(self.data, POINTER(c_char_p)).contents.value.decode('utf-8'))}
+        elif self.format.value == MpvFormat.NODE:
+            name = self.name.decode('utf-8')
+            _proptype, _access, *args = ALL_PROPERTIES.get(name, (node, None, False))
+            decode_str = args[0] if args else False
+            return {'name': name,
+                    'format': self.format,
+                    'data': self.data,
+                    'node': cast(c_void_p(self.data), POINTER(MpvNode)).contents.node_value(decode_str)}
         else:
             return {'name': self.name.decode('utf-8'),
                     'format': self.format,
@@ -354,7 +363,19 @@ def load_lua():
     CDLL('liblua.so', mode=RTLD_GLOBAL)
 
 
-def _event_loop(event_handle, playback_cond, event_callbacks, message_handlers, property_handlers, log_handler):
+def _cache_userdata(name):
+    return hash(('cache', name))&0xffffffffffffffff
+
+def _resolve_command_future(future, error):
+    try:
+        ErrorCode.raise_for_ec(error, None)
+    except Exception as ex:
+        future.set_exception(ex)
+    else:
+        future.set_result(None)
+
+def _event_loop(event_handle, playback_cond, event_callbacks, message_handlers, property_handlers, property_cache,
+        command_futures, log_handler):
     for event in _event_generator(event_handle):
         try:
             devent = event.as_dict() # copy data from ctypes
@@ -362,7 +383,16 @@ def _event_loop(event_handle, playback_cond, event_callbacks, message_handlers,
             if eid in (MpvEventID.SHUTDOWN, MpvEventID.END_FILE):
                 with playback_cond:
                     playback_cond.notify_all()
-            if eid == MpvEventID.PROPERTY_CHANGE:
+            if eid == MpvEventID.COMMAND_REPLY:
+                future = command_futures.pop(devent['reply_userdata'], None)
+                if future is not None:
+                    _resolve_command_future(future, devent['error'])
+            if eid == MpvEventID.PROPERTY_CHANGE and devent['reply_userdata'] == _cache_userdata(devent['event']['name']):
+                # observed with MPV_FORMAT_NODE by MPV.cache_property, value is already converted
+                pc = devent['event']
+                if pc['name'] in property_cache:
+                    property_cache[pc['name']] = pc.get('node')
+            elif eid == MpvEventID.PROPERTY_CHANGE:
                 pc = devent['event']
                 name = pc['name']
 
@@ -390,6 +420,8 @@ def _event_loop(event_handle, playback_cond, event_callbacks, message_handlers,
             for callback in event_callbacks:
                 callback(devent)
             if eid == MpvEventID.SHUTDOWN:
+                for userdata in list(command_futures):
+                    command_futures.pop(userdata).set_exception(RuntimeError('mpv was shut down'))
                 _mpv_detach_destroy(event_handle)
                 return
         except Exception as e:
@@ -415,12 +447,16 @@ class MPV(object):
 
         self._event_callbacks = []
         self._property_handlers = collections.defaultdict(lambda: [])
+        self._property_cache = {}
+        self._command_futures = {}
+        self._command_lock = threading.Lock()
+        self._command_userdata = 0
         self._message_handlers = {}
         self._key_binding_handlers = {}
         self._playback_cond = threading.Condition()
         self._event_handle = _mpv_create_client(self.handle, b'py_event_handler')
         loop = partial(_event_loop, self._event_handle, self._playback_cond, self._event_callbacks,
-                self._message_handlers, self._property_handlers, log_handler)
+                self._message_handlers, self._property_handlers, self._property_cache, self._command_futures, log_handler)
         self._event_thread = threading.Thread(target=loop, name='MPVEventHandlerThread')
         self._event_thread.setDaemon(True)
         self._event_thread.start()
@@ -456,11 +492,34 @@ class MPV(object):
     def set_loglevel(self, level):
         _mpv_request_log_messages(self._event_handle, level.encode('utf-8'))
 
-    def command(self, name, *args):
-        """ Execute a raw command """
+    @staticmethod
+    def _encode_command(name, args):
         args = [name.encode('utf-8')] + [ (arg if type(arg) is bytes else str(arg).encode('utf-8'))
                 for arg in args if arg is not None ] + [None]
-        _mpv_command(self.handle, (c_char_p*len(args))(*args))
+        return (c_char_p*len(args))(*args)
+
+    def command(self, name, *args):
+        """ Execute a raw command """
+        _mpv_command(self.handle, MPV._encode_command(name, args))
+
+    def command_async(self, name, *args, callback=None):
+        """ Execute a raw command without waiting for mpv. Returns a concurrent.futures.Future that is resolved from
+        the event thread when mpv replies (use asyncio.wrap_future to await it). If given, callback is called with the
+        future once it is done. """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        with self._command_lock:
+            self._command_userdata += 1
+            userdata = self._command_userdata
+            self._command_futures[userdata] = future
+        try:
+            # the reply goes to the client that sent the command, the one the event thread reads
+            _mpv_command_async(self._event_handle, userdata, MPV._encode_command(name, args))
+        except Exception as ex:
+            self._command_futures.pop(userdata, None)
+            future.set_exception(ex)
+        return future
 
     def seek(self, amount, reference="relative", precision="default-precise"):
         self.command('seek', amount, reference, precision)
@@ -575,6 +634,20 @@ class MPV(object):
         if not handlers:
             _mpv_unobserve_property(self._event_handle, hash(name)&0xffffffffffffffff)
 
+    def cache_property(self, name):
+        """ Keep a python copy of a node property (e.g. 'chapter-list') that is refreshed on every PROPERTY_CHANGE
+        event. Reading the property afterwards returns the cached value instead of querying mpv synchronously. """
+        if name in self._property_cache:
+            return
+        _proptype, _access, *args = ALL_PROPERTIES[name]
+        self._property_cache[name] = self._get_property(name, node, *args)
+        _mpv_observe_property(self._event_handle, _cache_userdata(name), name.encode('utf-8'), MpvFormat.NODE)
+
+    def uncache_property(self, name):
+        if name in self._property_cache:
+            del self._property_cache[name]
+            _mpv_unobserve_property(self._event_handle, _cache_userdata(name))
+
     def register_message_handler(self, target, handler):
         self._message_handlers[target] = handler
 
@@ -631,6 +704,9 @@ class MPV(object):
 
     # Property accessors
     def _get_property(self, name, proptype=str, decode_str=False):
+        if name in self._property_cache:
+            return self._property_cache[name]
+
         fmt = {int:         MpvFormat.INT64,
                float:       MpvFormat.DOUBLE,
                bool:        MpvFormat.FLAG,
@@ -0,0 +1,137 @@
+import os
+import sys
+import heapq
+import bisect
+
+import metrics
+from datafiles import CanTable
+from probe import probe_keyframes
+
+# throughputs and start cost assumed without a metrics file of earlier runs
+READ_RATE = 200 * 2**20 # ffmpeg stream copy, bytes/s
+DATA_RATE = 50 * 2**20 # data file cutting, bytes/s
+PROCESS_COST = 0.05 # s
+
+
+class JobPlan(object):
+    """ What one cut list line will read and write, computed from the cached indexes without running it. """
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.video = None
+        self.read_bytes = 0 # ffmpeg reads the input from its start (output seeking)
+        self.output_bytes = 0 # bytes between the keyframes around the cut
+        self.data_bytes = 0
+        self.data_rows = 0
+        self.error = None
+
+    def seconds(self, read_rate, data_rate):
+        return PROCESS_COST + self.read_bytes / read_rate + self.data_bytes / data_rate
+
+
+def plan_job(cutter, segment, ffprobe_bin):
+    job = JobPlan(segment)
+    input_file, _output_dir, start, end = segment[:4]
+    try:
+        job.video = cutter.get_input_video(input_file)
+        frame_duration = cutter.get_frame_duration(job.video)
+        keyframes = probe_keyframes(ffprobe_bin, job.video)
+        times = [t for t, _ in keyframes]
+        size = os.path.getsize(job.video)
+        first = max(bisect.bisect_right(times, start * frame_duration) - 1, 0)
+        last = bisect.bisect_left(times, (end + 1) * frame_duration)
+        end_pos = keyframes[last][1] if last < len(keyframes) else size
+        job.read_bytes = end_pos
+        job.output_bytes = end_pos - (keyframes[first][1] if keyframes else 0)
+        if os.path.isdir(input_file):
+            plan_data(cutter, job, input_file, start, end)
+    except (OSError, ValueError, IndexError, ZeroDivisionError) as e:
+        job.error = str(e)
+    return job
+
+
+def plan_data(cutter, job, input_dir, start, end):
+    """ Rows and bytes of the data files a line cuts, from the sync file's lookup table. """
+    metainfo = dict(cutter.read_metainfo(os.path.join(input_dir, 'metainfo.txt')))
+    sync = metainfo.get('sync')
+    min_canidx = max_canidx = None
+    frames = total_can = 1
+    if sync:
+        table = CanTable.open(os.path.join(input_dir, sync))
+        try:
+            frames = table.rows or 1
+            first, stop = table.offset(start - 1), table.offset(end) if end < table.rows else None
+            sync_size = os.path.getsize(os.path.join(input_dir, sync))
+            job.data_rows += end - start + 1
+            job.data_bytes += (stop if stop is not None else sync_size) - first
+            try:
+                min_canidx, max_canidx = table.can_range(start, end)
+                total_can = table.row(table.rows - 1)[2] or 1
+            except ValueError:
+                pass
+        finally:
+            table.close()
+
+    for key, value in metainfo.items():
+        if key in cutter.ignored_keys or key.endswith('_layout'):
+            continue
+        kind = cutter.stream_kinds.get(key, 'copy')
+        path = os.path.join(input_dir, value)
+        if key not in cutter.stream_kinds and not os.path.isfile(path):
+            continue # skipped by save_data_file
+        if kind == 'copy':
+            job.data_bytes += os.path.getsize(path)
+        elif kind == 'row_range':
+            job.data_rows += end - start + 1
+            job.data_bytes += os.path.getsize(path) * (end - start + 1) // frames
+        elif kind == 'can_range' and min_canidx is not None:
+            rows = max_canidx - min_canidx
+            job.data_rows += rows
+            job.data_bytes += os.path.getsize(path) * rows // total_can
+
+
+def measured_rates(metrics_file):
+    """ (read rate, data rate) in bytes/s observed in a metrics file, the defaults where it has no data. """
+    _per_input, per_stage = metrics.summarize(metrics_file)
+    rates = []
+    for stage, default in (('ffmpeg', READ_RATE), ('save_data_file', DATA_RATE)):
+        row = per_stage.get(stage)
+        rates.append(row['input_bytes'] / row['wall'] if row and row['wall'] and row['input_bytes'] else default)
+    return rates
+
+
+def schedule(durations, jobs):
+    """ Finish time of the list as JobRunner runs it: every line in order on the first free worker. """
+    workers = [0.0] * max(jobs, 1)
+    for duration in durations:
+        heapq.heapreplace(workers, workers[0] + duration)
+    return max(workers)
+
+
+def print_plan(cutter, segments, ffprobe_bin, jobs=1, metrics_file=None, out=sys.stdout):
+    read_rate, data_rate = measured_rates(metrics_file) if metrics_file else (READ_RATE, DATA_RATE)
+    plans = [plan_job(cutter, segment, ffprobe_bin) for segment in segments]
+
+    print('%-48s %10s %10s %10s %10s %10s' % ('', 'frames', 'read MB', 'out MB', 'data rows', 'est. s'), file=out)
+    for plan in plans:
+        input_file, _output_dir, start, end = plan.segment[:4]
+        name = '%s %d-%d' % (input_file, start, end)
+        if plan.error:
+            print('%-48s %s' % (name[-48:], plan.error), file=out)
+            continue
+        print('%-48s %10d %10.2f %10.2f %10d %10.2f' % (
+            name[-48:], end - start + 1, plan.read_bytes / 2**20, (plan.output_bytes + plan.data_bytes) / 2**20,
+            plan.data_rows, plan.seconds(read_rate, data_rate)), file=out)
+
+    ok = [plan for plan in plans if not plan.error]
+    durations = [plan.seconds(read_rate, data_rate) for plan in ok]
+    print(file=out)
+    print('%d jobs, %d failed to plan' % (len(plans), len(plans) - len(ok)), file=out)
+    print('read:   %.2f MB' % (sum(plan.read_bytes for plan in ok) / 2**20), file=out)
+    print('output: %.2f MB (%.2f MB video, %.2f MB data)' % (
+        sum(plan.output_bytes + plan.data_bytes for plan in ok) / 2**20,
+        sum(plan.output_bytes for plan in ok) / 2**20, sum(plan.data_bytes for plan in ok) / 2**20), file=out)
+    print('rows:   %d' % sum(plan.data_rows for plan in ok), file=out)
+    print('time:   %.1f s with %d jobs (%.1f s sequential, longest job %.1f s)' % (
+        schedule(durations, jobs), jobs, sum(durations), max(durations or [0])), file=out)
+    return plans
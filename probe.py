@@ -0,0 +1,129 @@
+import os
+import json
+import threading
+import subprocess
+import collections
+
+from profiling import tracer
+
+PROBE_CACHE_SIZE = 256
+
+
+class LRUCache(object):
+    """ Small thread safe least-recently-used mapping. """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                return default
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def fingerprint(filename):
+    """ Identifies a version of a file without reading it: a cached result for another fingerprint is stale. """
+    st = os.stat(filename)
+    return (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+
+
+streams_cache = LRUCache(PROBE_CACHE_SIZE)
+
+
+def probe_streams(ffprobe_bin, filename):
+    """ The streams of a media file as ffprobe reports them (index, codec_type, codec_name, tags, ...).
+    Results are cached per file version. Returns None without an ffprobe. """
+    if not ffprobe_bin:
+        return None
+    key = fingerprint(filename)
+    streams = streams_cache.get(key)
+    if streams is None:
+        cmd = [ffprobe_bin, '-v', 'error', '-show_streams', '-of', 'json', filename]
+        with tracer.span('ffprobe', args=' '.join(cmd)):
+            output = subprocess.check_output(cmd)
+        streams = json.loads(output.decode('utf-8', 'replace')).get('streams', [])
+        streams_cache.put(key, streams)
+    return streams
+
+
+def has_stream(streams, codec_type):
+    return any(s.get('codec_type') == codec_type for s in streams or ())
+
+
+keyframes_cache = LRUCache(PROBE_CACHE_SIZE)
+
+
+def probe_keyframes(ffprobe_bin, filename):
+    """ [(pts, byte position)] of the keyframes of the first video stream, cached per file version. """
+    key = fingerprint(filename)
+    keyframes = keyframes_cache.get(key)
+    if keyframes is None:
+        cmd = [ffprobe_bin, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,pos,flags',
+               '-of', 'csv=p=0', filename]
+        keyframes = []
+        with tracer.span('ffprobe', args=' '.join(cmd)):
+            output = subprocess.check_output(cmd)
+        for line in output.splitlines():
+            t, pos, flags = (line.split(b',') + [b'', b''])[:3]
+            if not flags.startswith(b'K'):
+                continue
+            try:
+                keyframes.append((float(t), int(pos)))
+            except ValueError: # N/A
+                continue
+        keyframes.sort()
+        keyframes_cache.put(key, keyframes)
+    return keyframes
+
+
+STREAM_TYPES = {'v': 'video', 'a': 'audio', 's': 'subtitle', 'd': 'data', 't': 'attachment'}
+
+
+def select_streams(streams, spec):
+    """ Indexes of the streams chosen by a comma separated selection: a stream index (2), a type (v, a, s, d, t
+    or video, audio, ...) or a type and language (a:eng). Every selector has to match at least one stream. """
+    selected = []
+    for selector in spec.split(','):
+        selector = selector.strip()
+        if not selector:
+            continue
+        if selector.isdigit():
+            matches = [s for s in streams if s.get('index') == int(selector)]
+        else:
+            codec_type, _, language = selector.partition(':')
+            codec_type = STREAM_TYPES.get(codec_type, codec_type)
+            matches = [s for s in streams if s.get('codec_type') == codec_type and
+                       (not language or s.get('tags', {}).get('language') == language)]
+        if not matches:
+            raise ValueError('No stream matches "%s" (streams: %s)' % (selector, describe_streams(streams)))
+        selected.extend(s['index'] for s in matches if s['index'] not in selected)
+    return selected
+
+
+def describe_streams(streams):
+    return ', '.join('%d %s%s' % (s.get('index'), s.get('codec_type'),
+                                   ':' + s['tags']['language'] if 'language' in s.get('tags', {}) else '')
+                     for s in streams)
+
+
+def stream_maps(streams, spec):
+    """ ffmpeg -map arguments of a stream selection, none without one. """
+    if not spec:
+        return []
+    if streams is None:
+        raise ValueError('Selecting streams needs ffprobe')
+    return [arg for index in select_streams(streams, spec) for arg in ('-map', '0:%d' % index)]
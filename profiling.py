@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import json
+import threading
+import contextlib
+import cProfile
+import pstats
+import collections
+from functools import wraps
+
+
+class Tracer(object):
+    """ Collects timing spans of the cutting stages and exports them in Chrome trace event format (open the file in
+    chrome://tracing or ui.perfetto.dev). While disabled a span costs one attribute check. """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def now(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add(name, start, self.now() - start, args)
+
+    def begin(self, name, **args):
+        """ Starts a span that ends somewhere else (e.g. a subprocess polled by a timer), see end(). """
+        if self.enabled:
+            return (name, self.now(), args)
+
+    def end(self, token, tid=None, **args):
+        if token is not None:
+            name, start, begin_args = token
+            self.add(name, start, self.now() - start, dict(begin_args, **args), tid)
+
+    def add(self, name, ts, dur, args, tid=None):
+        event = {
+            'name': name,
+            'cat': 'ffcutter',
+            'ph': 'X',
+            'ts': ts,
+            'dur': dur,
+            'pid': os.getpid(),
+            'tid': tid if tid is not None else threading.get_ident(),
+            'args': args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def summary(self):
+        """ Returns {span name: (count, total seconds)} """
+        totals = collections.OrderedDict()
+        with self.lock:
+            for event in self.events:
+                count, total = totals.get(event['name'], (0, 0))
+                totals[event['name']] = (count + 1, total + event['dur'] / 1e6)
+        return totals
+
+    def export(self, filename):
+        with self.lock:
+            events = list(self.events)
+        with open(filename, 'w') as fp:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
+
+
+tracer = Tracer()
+
+
+def traced(name):
+    """ Decorator that wraps every call of the function into a span. """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kw):
+            with tracer.span(name):
+                return func(*args, **kw)
+        return wrapper
+    return decorator
+
+
+class Session(object):
+    """ --profile / --trace handling of the command line. """
+
+    def __init__(self, trace_file=None, profile=False):
+        self.trace_file = trace_file
+        self.profiler = cProfile.Profile() if profile else None
+        tracer.enabled = True
+        if self.profiler:
+            self.profiler.enable()
+
+    def flush(self):
+        if self.trace_file:
+            tracer.export(self.trace_file)
+
+    def finish(self, out=sys.stdout):
+        self.flush()
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+
+        print('\nStages:', file=out)
+        for name, (count, total) in tracer.summary().items():
+            print('    %-28s %6d x %10.3fs' % (name, count, total), file=out)
+
+        if self.trace_file:
+            self.profiler.dump_stats(os.path.splitext(self.trace_file)[0] + '.prof')
+        print('\nPython hot spots:', file=out)
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(25)
@@ -0,0 +1,89 @@
+import os
+import bisect
+
+SPLIT_MODES = ('auto', 'segment', 'outputs')
+
+
+def arg_max():
+    try:
+        return os.sysconf('SC_ARG_MAX')
+    except (AttributeError, ValueError, OSError): # windows
+        return 32767
+
+
+def argv_size(args):
+    return sum(len(arg.encode()) + 1 for arg in args)
+
+
+def too_long(command):
+    """ Whether the command line and the environment exceed what the OS lets a process start with. """
+    env_size = sum(len(key) + len(value) + 2 for key, value in os.environ.items())
+    return argv_size(command) + env_size > arg_max()
+
+
+class SegmentSplit(object):
+    """ Cuts all segments of a copy plan in one sequential read of the input: ffmpeg's segment muxer splits the
+    input at every segment boundary into numbered pieces, afterwards the pieces that are segments are renamed to
+    their output names and the ones in between are deleted.
+
+    With stream copy the segment muxer can only start a piece on a keyframe, so each boundary moves to the first
+    keyframe at or after it. Overlapping segments can't be cut this way. """
+
+    def __init__(self, segments, outfiles, duration=None):
+        self.segments = segments
+        self.outfiles = outfiles
+        self.duration = duration
+        times = set()
+        for a, b in segments:
+            if a > 0:
+                times.add(a)
+            if duration is None or b < duration:
+                times.add(b)
+        self.times = sorted(times)
+        # piece k lies between times[k-1] and times[k]
+        self.pieces = [bisect.bisect_right(self.times, a) for a, b in segments]
+
+    @property
+    def possible(self):
+        return all(bisect.bisect_left(self.times, b) == piece
+                   for (a, b), piece in zip(self.segments, self.pieces)) and len(set(self.pieces)) == len(self.pieces)
+
+    def piece_pattern(self, outfile):
+        path_name, ext = os.path.splitext(outfile)
+        return '%s.split%%05d%s' % (path_name, ext)
+
+    def make_command(self, ffmpeg, filename, outfile, inargs=(), outargs=()):
+        return ([ffmpeg] + list(inargs) + ['-i', filename, '-y', '-c', 'copy'] + list(outargs) +
+                ['-f', 'segment', '-segment_times', ','.join('%.6f' % t for t in self.times),
+                 '-reset_timestamps', '1', self.piece_pattern(outfile)])
+
+    def finish(self, outfile):
+        """ Renames the wanted pieces, removes the others. Returns the output files. """
+        wanted = dict(zip(self.pieces, self.outfiles))
+        for piece, name in self.existing_pieces(outfile):
+            if piece in wanted:
+                os.replace(name, wanted[piece])
+            else:
+                os.remove(name)
+        return [f for f in self.outfiles if os.path.exists(f)]
+
+    def discard(self, outfile):
+        for _piece, name in self.existing_pieces(outfile):
+            os.remove(name)
+
+    def existing_pieces(self, outfile):
+        pattern = self.piece_pattern(outfile)
+        for piece in range(len(self.times) + 1):
+            name = pattern % piece
+            if os.path.exists(name):
+                yield piece, name
+
+
+def prefer_split(mode, command):
+    """ Whether a copy plan should go through the segment muxer: always for `segment`, never for `outputs`, and
+    for `auto` only if its command line is too long to run, since the pieces then start on keyframes. """
+    if mode == 'outputs':
+        return False
+    if mode == 'segment':
+        return True
+    return too_long(command)
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cutlist import CutList, CUT_LIST_EXTENSIONS
+from jobs import JobRunner
+from probe import LRUCache
+
+STATUS_SUFFIX = '.status.json'
+# metainfo.txt files and sync lookup tables kept open between lists
+METAINFO_CACHE_SIZE = 1024
+CAN_TABLE_CACHE_SIZE = 64
+
+
+def status_file(cut_list):
+    return cut_list + STATUS_SUFFIX
+
+
+def write_status(cut_list, **status):
+    filename = status_file(cut_list)
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(dict(status, list=os.path.basename(cut_list), time=time.strftime('%Y-%m-%dT%H:%M:%S')), fp,
+                  indent=1)
+    os.replace(tmp, filename)
+
+
+class Server(object):
+    """ Watches a directory for new cut lists and runs them one after another on a worker pool that lives as long
+    as the server, with the probe, metainfo and sync table caches kept warm between lists.
+
+    A list is picked up once its size and mtime stayed the same for one poll (so it isn't read while it's being
+    written) and as long as it has no status file: <list>.status.json is written when it starts and when it's
+    done. Deleting the status file runs the list again. """
+
+    def __init__(self, cutter, watch_dir, jobs=1, poll=2.0, log=print, log_error=print):
+        self.cutter = cutter
+        self.watch_dir = watch_dir
+        self.jobs = jobs
+        self.poll = poll
+        self.log = log
+        self.log_error = log_error
+        self.seen = {} # cut list -> (size, mtime) of the last poll
+        self.runner = None
+        self.stopped = False
+        cutter.log_error = log_error
+        cutter.metainfo_cache = LRUCache(METAINFO_CACHE_SIZE)
+        cutter.can_table_cache = LRUCache(CAN_TABLE_CACHE_SIZE)
+
+    def new_lists(self):
+        """ Cut lists without a status file that didn't change since the last poll, oldest first. """
+        ready = []
+        current = {}
+        for name in os.listdir(self.watch_dir):
+            path = os.path.join(self.watch_dir, name)
+            if os.path.splitext(name)[1].lower() not in CUT_LIST_EXTENSIONS or os.path.exists(status_file(path)):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError: # removed meanwhile
+                continue
+            current[path] = (st.st_size, st.st_mtime_ns)
+            if self.seen.get(path) == current[path]:
+                ready.append((st.st_mtime_ns, path))
+        self.seen = current
+        return [path for _, path in sorted(ready)]
+
+    def serve(self):
+        self.log('Watching %s for cut lists (%d jobs)' % (self.watch_dir, self.jobs))
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while not self.stopped:
+                for cut_list in self.new_lists():
+                    if self.stopped:
+                        break
+                    self.run_list(cut_list, pool)
+                time.sleep(self.poll)
+
+    def run_list(self, cut_list, pool):
+        started = time.time()
+        write_status(cut_list, state='running')
+        self.log('\n%s' % cut_list)
+        reader = CutList(cut_list, self.log_error)
+        self.runner = JobRunner(self.cutter, self.jobs, self.log, self.log_error)
+        try:
+            code = self.runner.run(reader, pool)
+        except Exception as e:
+            self.log_error('%s failed: %s' % (cut_list, e))
+            code = 1
+        if code == 0 and reader.lines == reader.skipped:
+            code = 1
+        if self.runner.interrupted:
+            state = 'interrupted'
+        else:
+            state = 'done' if code == 0 else 'failed'
+        write_status(cut_list, state=state, exit_code=code, lines=reader.lines, skipped=reader.skipped,
+                     jobs_started=self.runner.started, seconds=round(time.time() - started, 3))
+        self.log('%s: %s' % (cut_list, state))
+        self.runner = None
+
+    def stop(self):
+        self.stopped = True
+        if self.runner is not None:
+            self.runner.interrupt()
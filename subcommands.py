@@ -0,0 +1,66 @@
+import os
+import sys
+import signal
+import shutil
+import subprocess
+
+import metrics
+from cutter import Cutter
+from cutlist import CutList
+from planner import print_plan
+from server import Server
+from virtual import materialize_command
+
+# ffcutter <command> ... that run without the GUI, ffcutter.py dispatches them before importing Qt and libmpv
+COMMANDS = ('report', 'plan', 'serve', 'materialize')
+
+
+def find_binary(name):
+    """ name.exe next to the program (bundled builds) or name on the PATH. """
+    directory = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(sys.argv[0])))
+    return shutil.which(os.path.join(directory, name + '.exe')) or shutil.which(name)
+
+
+def run(args):
+    """ Runs the command of the parsed ffcutter arguments. """
+    if args['report']:
+        metrics.print_report(args['<metrics-file>'])
+    elif args['plan']:
+        plan(args)
+    elif args['serve']:
+        serve(args)
+    elif args['materialize']:
+        materialize(args['<playlist>'])
+
+
+def plan(args):
+    ffprobe = find_binary('ffprobe')
+    if not ffprobe:
+        sys.exit('FFprobe weren\'t found.')
+    cutter = Cutter(find_binary('ffmpeg'), ffprobe)
+    print_plan(cutter, CutList(args['<cut-list>']), ffprobe, int(args['--jobs']), args['--metrics'])
+
+
+def serve(args):
+    ffmpeg, ffprobe = find_binary('ffmpeg'), find_binary('ffprobe')
+    if not ffmpeg:
+        sys.exit('FFmpeg weren\'t found.')
+    cutter = Cutter(ffmpeg, ffprobe)
+    cutter.streams = args['--streams']
+    if args['--metrics']:
+        metrics.recorder.open(args['--metrics'])
+    server = Server(cutter, args['--watch'], int(args['--jobs']), float(args['--poll']))
+    signal.signal(signal.SIGINT, lambda *_: server.stop())
+    server.serve()
+
+
+def materialize(playlists):
+    ffmpeg = find_binary('ffmpeg')
+    if not ffmpeg:
+        sys.exit('FFmpeg weren\'t found.')
+    for playlist in playlists:
+        cmd = materialize_command(ffmpeg, playlist)
+        print(' '.join(cmd))
+        code = subprocess.call(cmd)
+        if code != 0:
+            sys.exit('Fail. Command exit code: %s' % code)
@@ -0,0 +1,83 @@
+import os
+import math
+import bisect
+
+VIRTUAL_FORMATS = ('auto', 'm3u8', 'ffconcat')
+TS_EXTENSIONS = ('.ts', '.m2ts', '.mts')
+
+
+def virtual_format(fmt, filename):
+    """ HLS byte ranges can only point into MPEG-TS files, other containers get ffconcat in/out points. """
+    if fmt == 'auto':
+        return 'm3u8' if os.path.splitext(filename)[1].lower() in TS_EXTENSIONS else 'ffconcat'
+    return fmt
+
+
+def playlist_path(playlist, filename):
+    """ The media file as seen from the playlist, relative when possible so both can be moved together. """
+    try:
+        return os.path.relpath(os.path.abspath(filename), os.path.dirname(os.path.abspath(playlist)))
+    except ValueError: # another drive
+        return os.path.abspath(filename)
+
+
+def write_m3u8(playlist, filename, start, end, keyframes):
+    """ HLS playlist of byte ranges of the original file, one entry per GOP from the keyframe at or before start
+    to the first keyframe at or after end. """
+    times = [t for t, _ in keyframes]
+    first = max(bisect.bisect_right(times, start) - 1, 0)
+    last = bisect.bisect_left(times, end)
+    size = os.path.getsize(filename)
+    uri = playlist_path(playlist, filename).replace(os.sep, '/')
+
+    entries = []
+    for k in range(first, min(last, len(keyframes))):
+        t, pos = keyframes[k]
+        next_t, next_pos = keyframes[k + 1] if k + 1 < len(keyframes) else (None, size)
+        duration = (next_t if next_t is not None else end) - t
+        entries.append((duration, next_pos - pos, pos))
+
+    with open(playlist, 'w', encoding='utf-8', newline='\n') as fp:
+        fp.write('#EXTM3U\n#EXT-X-VERSION:4\n#EXT-X-PLAYLIST-TYPE:VOD\n#EXT-X-MEDIA-SEQUENCE:0\n')
+        fp.write('#EXT-X-TARGETDURATION:%d\n' % math.ceil(max([d for d, _, _ in entries] or [1])))
+        for duration, length, offset in entries:
+            fp.write('#EXTINF:%.6f,\n#EXT-X-BYTERANGE:%d@%d\n%s\n' % (duration, length, offset, uri))
+        fp.write('#EXT-X-ENDLIST\n')
+
+
+def write_ffconcat(playlist, filename, start, end):
+    with open(playlist, 'w', encoding='utf-8', newline='\n') as fp:
+        fp.write('ffconcat version 1.0\n')
+        fp.write("file '%s'\n" % playlist_path(playlist, filename).replace("'", "'\\''"))
+        fp.write('inpoint %.6f\noutpoint %.6f\n' % (start, end))
+
+
+def write_virtual_cut(fmt, playlist, filename, start, end, keyframes=None):
+    if fmt == 'm3u8':
+        write_m3u8(playlist, filename, start, end, keyframes)
+    else:
+        write_ffconcat(playlist, filename, start, end)
+
+
+def media_extension(playlist):
+    """ Extension of the first media file a playlist refers to. """
+    with open(playlist, encoding='utf-8') as fp:
+        for line in fp:
+            line = line.strip()
+            if line.startswith('file '):
+                line = line[5:].strip().strip("'")
+            elif not line or line.startswith(('#', 'ffconcat', 'inpoint', 'outpoint')):
+                continue
+            return os.path.splitext(line)[1]
+    return ''
+
+
+def materialize_command(ffmpeg, playlist, outfile=None):
+    """ ffmpeg command that turns a virtual cut into a file by stream copy. """
+    if outfile is None:
+        outfile = os.path.splitext(playlist)[0] + media_extension(playlist)
+    if playlist.endswith('.m3u8'):
+        inargs = ['-allowed_extensions', 'ALL', '-i', playlist]
+    else:
+        inargs = ['-f', 'concat', '-safe', '0', '-i', playlist]
+    return [ffmpeg, '-v', 'error', '-y'] + inargs + ['-map', '0', '-c', 'copy', outfile]